@@ -0,0 +1,534 @@
+import re
+import time
+import random
+import asyncio
+import logging
+import websockets
+from abc import ABC, abstractmethod
+from enum import Enum, auto
+
+from api.frames import FrameDecodeError, FrameValidationError, decode_frame, json_dumps, json_dumps_bytes, json_loads
+from api.message_state import MessageState
+
+logger = logging.getLogger(__name__)
+
+WS_BASE_URL = "wss://replit.com/river/wsv2"
+
+class ConnectionState(Enum):
+    """States for the WebSocket connection state machine"""
+    DISCONNECTED = auto()
+    CONNECTING = auto()
+    CONNECTED = auto()
+    HANDSHAKING = auto()
+    NO_CONNECTION = auto()
+    BACKING_OFF = auto()
+    ERROR = auto()
+    CLOSED = auto()
+
+# Matches a JSON string value, for pulling content out of a frame in place
+_CONTENT_RE = re.compile(r'"content"\s*:\s*"((?:[^"\\]|\\.)*)"', re.DOTALL)
+_CONTENT_RE_BYTES = re.compile(rb'"content"\s*:\s*"((?:[^"\\]|\\.)*)"', re.DOTALL)
+
+# Matches a JSON object with no nested objects or arrays outside its string
+# values; only such frames have every key at the top level
+_FLAT_OBJECT_RE = re.compile(r'\s*\{(?:[^{}\[\]"]|"(?:[^"\\]|\\.)*")*\}\s*', re.DOTALL)
+_FLAT_OBJECT_RE_BYTES = re.compile(rb'\s*\{(?:[^{}\[\]"]|"(?:[^"\\]|\\.)*")*\}\s*', re.DOTALL)
+
+class Dialect:
+    """Frame types and field names of one agent message envelope format"""
+
+    __slots__ = ('query_type', 'query_field', 'id_field', 'stream_type', 'complete_type',
+                 '_stream_re', '_id_re', '_stream_re_bytes', '_id_re_bytes')
+
+    def __init__(self, query_type, query_field, id_field, stream_type, complete_type):
+        """Initialize the dialect
+
+        Args:
+            query_type (str): Type of outbound query frames
+            query_field (str): Field holding the query text
+            id_field (str): Field holding the message ID in both directions
+            stream_type (str): Type of inbound content delta frames
+            complete_type (str): Type of the inbound frame that ends a response
+        """
+        self.query_type = query_type
+        self.query_field = query_field
+        self.id_field = id_field
+        self.stream_type = stream_type
+        self.complete_type = complete_type
+
+        # A quoted key only matches at the JSON level, since the same text
+        # inside a string value has its quotes escaped
+        stream_re = r'"type"\s*:\s*"%s"' % re.escape(stream_type)
+        id_re = r'"%s"\s*:\s*"([^"\\]*)"' % re.escape(id_field)
+        self._stream_re = re.compile(stream_re)
+        self._id_re = re.compile(id_re)
+        self._stream_re_bytes = re.compile(stream_re.encode())
+        self._id_re_bytes = re.compile(id_re.encode())
+
+    def fast_extract(self, message):
+        """Extract the fields of a stream delta frame without a full parse
+
+        Binary frames are sliced through a memoryview and decoded straight from
+        the frame buffer, so the content is copied once rather than being copied
+        out as bytes and then decoded again. Frames with nested objects or
+        arrays take the full parse, since a key found by searching could
+        belong to a nested object rather than the frame itself.
+
+        Args:
+            message (str or bytes): Raw WebSocket frame
+
+        Returns:
+            tuple: (message_id, content), or None if the frame is not a stream
+                delta and needs a full parse
+        """
+        if isinstance(message, str):
+            if not self._stream_re.search(message) or not _FLAT_OBJECT_RE.fullmatch(message):
+                return None
+            id_match = self._id_re.search(message)
+            content_match = _CONTENT_RE.search(message)
+            if not id_match or not content_match:
+                return None
+            message_id = id_match.group(1)
+            content = content_match.group(1)
+        elif isinstance(message, (bytes, bytearray)):
+            if not self._stream_re_bytes.search(message) or not _FLAT_OBJECT_RE_BYTES.fullmatch(message):
+                return None
+            id_match = self._id_re_bytes.search(message)
+            content_match = _CONTENT_RE_BYTES.search(message)
+            if not id_match or not content_match:
+                return None
+            view = memoryview(message)
+            message_id = str(view[id_match.start(1):id_match.end(1)], 'utf-8')
+            content = str(view[content_match.start(1):content_match.end(1)], 'utf-8')
+        else:
+            return None
+
+        if '\\' in content:
+            # Only pay for a decode when the content actually contains escapes
+            content = json_loads(f'"{content}"')
+
+        return message_id, content
+
+class AgentWebSocketClient(ABC):
+    """Shared connection, send and response-tracking logic for the agent WebSocket clients
+
+    Subclasses provide a Dialect and the connection-specific hooks; every
+    frame goes through the single _process_messages hot path here.
+    """
+
+    dialect = None
+    connect_timeout = 30  # Seconds to wait for the connection to become ready
+    # Send query frames as UTF-8 bytes straight from the encoder. websockets
+    # sends bytes with the binary opcode, so only enable this for servers that
+    # accept binary frames; text frames cost one extra encode per send.
+    binary_frames = False
+
+    def __init__(self, auth_data=None):
+        """Initialize the client
+
+        Args:
+            auth_data (dict, optional): Authentication data including tokens
+        """
+        self.auth_data = auth_data
+        self.ws = None
+        self.url = WS_BASE_URL
+        self.state = ConnectionState.DISCONNECTED
+        self.task = None  # Background task owning the connection
+        self.last_error = None  # Exception that ended the connection task, if any
+        self._ws_ready = asyncio.Event()
+        self._states = {}  # message_id -> MessageState
+        self._cookie_header = None  # Built lazily from auth_data['cookies']
+        self._send_q = asyncio.Queue()  # Outbound (payload, future) pairs
+        self._writer_task = None
+        self._payload_prefix = None  # Fixed part of every query frame
+        self.backoff_time = 1  # Base backoff time in seconds
+        self.max_backoff_time = 30  # Maximum backoff time in seconds
+        self._last_backoff = self.backoff_time
+
+    # Hooks for subclasses
+
+    async def _prepare_connection(self):
+        """Get everything needed to connect ready before the first attempt
+
+        Returns:
+            bool: True if the client can connect, False otherwise
+        """
+        return True
+
+    def _get_headers(self):
+        """Construct headers for the WebSocket connection"""
+        return {}
+
+    def _connect_kwargs(self):
+        """Extra keyword arguments for websockets.connect
+
+        Frames are small JSON documents full of random IDs, so per-message
+        deflate buys little on the wire and costs a decompress per frame.
+        The 1 MiB write buffer lets large frames go out without pausing.
+        """
+        return {
+            'compression': None,
+            'write_limit': 2 ** 20,
+            'max_queue': 64,
+        }
+
+    def _session_fields(self):
+        """Fields sent unchanged with every query frame on this connection"""
+        return {}
+
+    @abstractmethod
+    def _new_message_id(self):
+        """Generate an ID for an outbound message"""
+
+    async def _on_open(self, ws):
+        """Called for each new socket before frames are read from it
+
+        Args:
+            ws: The freshly opened WebSocket connection
+        """
+
+    async def _handle_frame(self, frame, message):
+        """Handle a frame that is not part of an agent response
+
+        Args:
+            frame (Frame): Decoded frame
+            message (str or bytes): Raw WebSocket frame
+        """
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received message of type %s: %.100s...", frame.type, message)
+
+    # Connection management
+
+    def _cookie_header_value(self):
+        """Get the Cookie header built from the auth data, or None if there are no cookies"""
+        if not self.auth_data or 'cookies' not in self.auth_data:
+            return None
+        if self._cookie_header is None:
+            self._cookie_header = "; ".join(f"{name}={value}" for name, value in self.auth_data['cookies'].items())
+        return self._cookie_header
+
+    def _mark_ready(self):
+        """Mark the connection as ready to carry queries"""
+        self.state = ConnectionState.CONNECTED
+        self._last_backoff = self.backoff_time
+        self._ws_ready.set()
+        logger.info("WebSocket connection established successfully")
+
+    async def connect(self, timeout=None):
+        """Start the connection task and wait until the connection is ready
+
+        Args:
+            timeout (int, optional): Maximum time to wait for the connection in seconds
+
+        Returns:
+            bool: True if connected, False otherwise
+        """
+        if self._ws_ready.is_set():
+            return True
+
+        if self.task is None or self.task.done():
+            if not await self._prepare_connection():
+                self.state = ConnectionState.ERROR
+                return False
+
+            # Everything but the query text and message ID is fixed for this
+            # connection, so serialize it once and leave the object open
+            fields = {"type": self.dialect.query_type}
+            fields.update(self._session_fields())
+            if self.binary_frames:
+                self._payload_prefix = json_dumps_bytes(fields)[:-1] + b","
+            else:
+                self._payload_prefix = json_dumps(fields)[:-1] + ","
+
+            self.state = ConnectionState.CONNECTING
+            self.last_error = None
+            logger.info("Connecting to WebSocket at %s", self.url)
+            self.task = asyncio.create_task(self._run())
+        else:
+            logger.info("Connection already in progress")
+
+        # Also wait on the connection task, so a connection that can never
+        # open (rejected handshake, bad URL) fails at once instead of at the timeout
+        task = self.task
+        ready = asyncio.create_task(self._ws_ready.wait())
+        try:
+            await asyncio.wait({ready, task}, timeout=timeout or self.connect_timeout,
+                               return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            ready.cancel()
+
+        if self._ws_ready.is_set():
+            return True
+        if task.done():
+            logger.error("WebSocket connection failed: %s", self.last_error)
+            return False
+        logger.error("Timed out waiting for WebSocket connection")
+        await self.close()
+        return False
+
+    async def _run(self):
+        """Keep a single connection open, reconnecting automatically when it drops"""
+        try:
+            async for ws in websockets.connect(self.url, additional_headers=self._get_headers(), **self._connect_kwargs()):
+                self.ws = ws
+                try:
+                    await self._on_open(ws)
+                    await self._process_messages()
+                except websockets.exceptions.ConnectionClosed as e:
+                    logger.warning("WebSocket connection closed: %s", e)
+                finally:
+                    self._ws_ready.clear()
+                    # Responses to queries sent on this socket will never arrive
+                    self._abort_pending(sent_only=True)
+
+                # Back off before letting websockets reconnect, so many
+                # clients dropped at once do not reconnect in lockstep
+                self.state = ConnectionState.BACKING_OFF
+                backoff = self._next_backoff()
+                logger.info("Backing off for %.1fs before reconnecting", backoff)
+                await asyncio.sleep(backoff)
+                self.state = ConnectionState.NO_CONNECTION
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Error in message processing: %s", e)
+            self.last_error = e
+            self.state = ConnectionState.ERROR
+            self._abort_pending()
+
+    def _next_backoff(self):
+        """Compute the next reconnect delay using decorrelated jitter
+
+        Returns:
+            float: Delay in seconds, between the base and maximum backoff time
+        """
+        self._last_backoff = min(
+            self.max_backoff_time,
+            random.uniform(self.backoff_time, self._last_backoff * 3)
+        )
+        return self._last_backoff
+
+    # Inbound path
+
+    async def _process_messages(self):
+        """Process incoming WebSocket messages until the connection closes"""
+        dialect = self.dialect
+        async for message in self.ws:
+            try:
+                # Fast path: stream deltas only need the message ID and content
+                fast = dialect.fast_extract(message)
+                if fast is not None:
+                    await self._on_stream(*fast)
+                    continue
+
+                # Decode the message into a typed frame
+                frame = decode_frame(message)
+                message_type = frame.type
+
+                if message_type == dialect.stream_type:
+                    await self._on_stream(getattr(frame, dialect.id_field), frame.content)
+                elif message_type == dialect.complete_type:
+                    await self._on_complete(getattr(frame, dialect.id_field), frame.content)
+                else:
+                    await self._handle_frame(frame, message)
+
+            except FrameValidationError:
+                logger.warning("Received JSON message that is not an object: %.100s...", message)
+            except FrameDecodeError:
+                logger.warning("Received non-JSON message: %.100s...", message)
+            except Exception as e:
+                logger.exception("Error processing message: %s", e)
+
+    async def _on_stream(self, message_id, content):
+        """Buffer a content delta and forward it to the update callback"""
+        state = self._states.get(message_id)
+        if state is not None:
+            state.buf.append(content)
+            state.updated_at = time.time()
+
+            if state.on_update:
+                await state.on_update(content)
+
+    async def _on_complete(self, message_id, content):
+        """Finish a response and wake up whoever is waiting for it"""
+        state = self._states.get(message_id)
+        if state is not None:
+            # Prefer the final payload, fall back to the streamed deltas
+            content = content or state.content()
+            state.complete = True
+
+            if state.on_complete:
+                await state.on_complete(content)
+
+            try:
+                state.future.set_result(content)
+            except asyncio.InvalidStateError:
+                # Waiter already timed out or was cancelled
+                pass
+
+    # Outbound path
+
+    async def _submit(self, text, message_id=None, on_update=None, on_complete=None):
+        """Send a query and register tracking for its response
+
+        Args:
+            text (str): Message text to send
+            message_id (str, optional): Unique ID for this message. Generated if None.
+            on_update (callable, optional): Callback for content updates
+            on_complete (callable, optional): Callback when response is complete
+
+        Returns:
+            str: Message ID for tracking the response
+
+        Raises:
+            Exception: If the connection could not be established or the send failed
+        """
+        if not self._ws_ready.is_set():
+            if not await self.connect():
+                raise Exception("Failed to connect to WebSocket")
+
+        if message_id is None:
+            message_id = self._new_message_id()
+
+        # Register response tracking and handlers
+        self._states[message_id] = MessageState(
+            on_update=on_update,
+            on_complete=on_complete,
+            future=asyncio.get_running_loop().create_future()
+        )
+
+        # Build the frame from the precomputed prefix
+        dialect = self.dialect
+        if self.binary_frames:
+            payload = b'%s"%s":%s,"%s":%s}' % (
+                self._payload_prefix, dialect.query_field.encode(), json_dumps_bytes(text),
+                dialect.id_field.encode(), json_dumps_bytes(message_id)
+            )
+        else:
+            payload = f'{self._payload_prefix}"{dialect.query_field}":{json_dumps(text)},"{dialect.id_field}":{json_dumps(message_id)}}}'
+
+        try:
+            await self._send(payload)
+        except Exception:
+            self._states.pop(message_id, None)
+            raise
+        state = self._states.get(message_id)
+        if state is not None:
+            state.sent = True
+
+        logger.info("Sent message with ID %s", message_id)
+        return message_id
+
+    async def _send(self, payload):
+        """Queue a frame for the writer task and wait until it is written
+
+        Args:
+            payload (str or bytes): Serialized frame to send
+        """
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._writer())
+
+        written = asyncio.get_running_loop().create_future()
+        self._send_q.put_nowait((payload, written))
+        await written
+
+    async def _writer(self):
+        """Drain the send queue, flushing every frame queued in the same tick back-to-back"""
+        while True:
+            pending = [await self._send_q.get()]
+            while not self._send_q.empty():
+                pending.append(self._send_q.get_nowait())
+
+            for payload, written in pending:
+                try:
+                    await self.ws.send(payload)
+                except Exception as e:
+                    if not written.done():
+                        written.set_exception(e)
+                else:
+                    if not written.done():
+                        written.set_result(None)
+
+    async def wait_for_response(self, message_id, timeout=60):
+        """Wait for a complete response to a message
+
+        Args:
+            message_id (str): ID of the message to wait for
+            timeout (int): Maximum time to wait in seconds
+
+        Returns:
+            str: Complete response or None if timed out or error
+        """
+        state = self._states.get(message_id)
+        if state is None:
+            logger.error("No response tracking for message ID %s", message_id)
+            return None
+
+        try:
+            # Resolved by _on_complete, or with None by _abort_pending if the
+            # connection is lost
+            response = await asyncio.wait_for(state.future, timeout=timeout)
+            if response is None:
+                logger.error("Connection error while waiting for response to %s", message_id)
+            return response
+        except asyncio.TimeoutError:
+            logger.warning("Timeout waiting for response to message %s", message_id)
+            return None
+        finally:
+            # Stop tracking the message once the caller is done with it
+            self._states.pop(message_id, None)
+
+    def _abort_pending(self, sent_only=False):
+        """Release everyone waiting on a response after the connection is lost
+
+        Args:
+            sent_only (bool): Only release messages already written to the lost
+                socket; queued ones are still sent once the client reconnects
+        """
+        for state in self._states.values():
+            if sent_only and not state.sent:
+                continue
+            if state.future is not None and not state.future.done():
+                state.future.set_result(None)
+
+    # Shutdown
+
+    async def _cancel(self, task):
+        """Cancel a background task and wait for it to finish"""
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def close(self):
+        """Close the WebSocket connection"""
+        logger.info("Closing WebSocket connection")
+        try:
+            # Stop reconnecting before closing the socket itself
+            await self._cancel(self.task)
+            self.task = None
+            await self._cancel(self._writer_task)
+            self._writer_task = None
+
+            if self.ws is not None:
+                await self.ws.close()
+                self.ws = None
+
+            logger.info("WebSocket connection closed")
+        except Exception as e:
+            logger.error("Error closing WebSocket connection: %s", e)
+        finally:
+            self.state = ConnectionState.CLOSED
+            self._ws_ready.clear()
+            self._abort_pending()
+
+    def is_connected(self):
+        """Check if the WebSocket is connected
+
+        Returns:
+            bool: True if connected, False otherwise
+        """
+        return self._ws_ready.is_set()
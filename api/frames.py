@@ -0,0 +1,116 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+    json_loads = orjson.loads
+
+    json_dumps_bytes = orjson.dumps
+
+    def json_dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    json_loads = json.loads
+    json_dumps = json.dumps
+
+    def json_dumps_bytes(obj):
+        return json.dumps(obj).encode()
+
+# Fields read from inbound frames by the WebSocket clients
+FRAME_FIELDS = ('type', 'id', 'messageId', 'content', 'connId', 'state', 'prev')
+
+
+def _as_text(value):
+    """Coerce a frame field to the string the clients expect
+
+    Servers occasionally send null, numeric IDs or nested objects; these are
+    normalised so both decoders hand the clients the same values.
+
+    Args:
+        value: Field value as decoded from JSON
+
+    Returns:
+        str: The value, '' for null, or its JSON text for anything else
+    """
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return str(value)
+    return json_dumps(value)
+
+
+class FrameValidationError(ValueError):
+    """A frame was valid JSON but not a JSON object"""
+
+
+try:
+    import msgspec
+
+    class Frame(msgspec.Struct):
+        """Inbound WebSocket frame decoded straight into slots"""
+        type: Any = ''
+        id: Any = ''
+        messageId: Any = ''
+        content: Any = ''
+        connId: Any = ''
+        state: Any = ''
+        prev: Any = ''
+
+        def __post_init__(self):
+            for name in FRAME_FIELDS:
+                value = getattr(self, name)
+                if value.__class__ is not str:
+                    setattr(self, name, _as_text(value))
+
+    FrameDecodeError = msgspec.DecodeError
+    _frame_decoder = msgspec.json.Decoder(Frame)
+
+    def decode_frame(message):
+        """Decode a raw WebSocket frame
+
+        Args:
+            message (str or bytes): Raw WebSocket frame
+
+        Returns:
+            Frame: Decoded frame, with missing fields left empty
+
+        Raises:
+            FrameValidationError: If the frame is JSON but not an object
+            FrameDecodeError: If the frame is not valid JSON
+        """
+        try:
+            return _frame_decoder.decode(message)
+        except msgspec.ValidationError as e:
+            raise FrameValidationError(str(e)) from e
+
+except ImportError:
+
+    class Frame:
+        """Inbound WebSocket frame, built from a parsed dict when msgspec is unavailable"""
+        __slots__ = FRAME_FIELDS
+
+        def __init__(self, data):
+            for name in FRAME_FIELDS:
+                setattr(self, name, _as_text(data.get(name)))
+
+    FrameDecodeError = ValueError  # json.JSONDecodeError and orjson's both subclass it
+
+    def decode_frame(message):
+        """Decode a raw WebSocket frame
+
+        Args:
+            message (str or bytes): Raw WebSocket frame
+
+        Returns:
+            Frame: Decoded frame, with missing fields left empty
+
+        Raises:
+            FrameValidationError: If the frame is JSON but not an object
+            FrameDecodeError: If the frame is not valid JSON
+        """
+        data = json_loads(message)
+        if not isinstance(data, dict):
+            raise FrameValidationError("WebSocket frame is not a JSON object")
+        return Frame(data)
@@ -0,0 +1,35 @@
+import time
+
+class MessageState:
+    """Per-message tracking state shared by the WebSocket clients
+
+    Keeps everything the reader loop needs for one in-flight message in a
+    single slotted object, so each inbound frame costs one dict lookup.
+    """
+
+    __slots__ = ('buf', 'future', 'on_update', 'on_complete', 'created_at', 'updated_at', 'complete', 'sent')
+
+    def __init__(self, on_update=None, on_complete=None, future=None):
+        """Initialize message state
+
+        Args:
+            on_update (callable, optional): Callback for content updates
+            on_complete (callable, optional): Callback when response is complete
+            future (asyncio.Future, optional): Future resolved with the full response
+        """
+        self.buf = []
+        self.future = future
+        self.on_update = on_update
+        self.on_complete = on_complete
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.complete = False
+        self.sent = False  # Set once the query frame has been written to a socket
+
+    def content(self):
+        """Get the content received so far
+
+        Returns:
+            str: Concatenation of all buffered chunks
+        """
+        return ''.join(self.buf)
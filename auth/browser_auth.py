@@ -1,16 +1,290 @@
 import os
 import json
 import time
+import queue
+import atexit
 import logging
-import traceback
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 logger = logging.getLogger(__name__)
 
+# Cookie export sameSite spellings mapped to the values CDP accepts
+SAME_SITE_VALUES = {'strict': 'Strict', 'lax': 'Lax', 'none': 'None', 'no_restriction': 'None'}
+
+# Any of the chat input variants on the AI page, matched in one lookup
+INPUT_SELECTOR = ", ".join((
+    "textarea[placeholder*='Ask']",
+    "textarea[placeholder*='Message']",
+    "textarea[placeholder*='Type']",
+    "div[contenteditable='true']",
+    "input[placeholder*='Message']"
+))
+
+# Login links or buttons, only present when the session is not logged in
+LOGIN_SELECTOR = "a[href*='/login'], button[data-cy='login'], button[data-testid='login']"
+
+# Everything extract_browser_state needs from the page, gathered in one
+# Runtime.evaluate: the login check, a single pass over each storage area
+# bucketing auth and feature-flag keys, then the window globals and
+# WebSocket entries
+BROWSER_STATE_JS = """(() => {
+    const isAuthKey = key => key.includes('token') || key.includes('auth') ||
+        key.includes('session') || key.includes('user');
+    const isFlagKey = key => key.includes('LaunchDarkly') || key.includes('flag-') || key.includes('feature');
+    
+    try {
+        const localItems = {};
+        const sessionItems = {};
+        const authData = {};
+        const flagData = {};
+        
+        for (let i = 0; i < localStorage.length; i++) {
+            const key = localStorage.key(i);
+            const value = localStorage.getItem(key);
+            localItems[key] = value;
+            if (isAuthKey(key)) authData[`localStorage_${key}`] = value;
+            if (isFlagKey(key)) flagData[key] = value;
+        }
+        
+        for (let i = 0; i < sessionStorage.length; i++) {
+            const key = sessionStorage.key(i);
+            const value = sessionStorage.getItem(key);
+            sessionItems[key] = value;
+            if (isAuthKey(key)) authData[`sessionStorage_${key}`] = value;
+        }
+        
+        const storedParam = name => localItems[name] || sessionItems[name] || null;
+        
+        return {
+            local_storage: localItems,
+            session_tokens: {
+                storage: authData,
+                userData: JSON.stringify(window.__INITIAL_DATA__ || window.__PRELOADED_STATE__ || {})
+            },
+            websocket_params: {
+                wsUrls: performance.getEntriesByType("resource")
+                    .filter(r => r.name.includes('wss://') || r.name.includes('ws://'))
+                    .map(r => r.name),
+                sessionId: storedParam('sessionId'),
+                clientId: storedParam('clientId'),
+                anonymousId: storedParam('anonymousId')
+            },
+            feature_flags: {
+                localStorage: flagData,
+                windowFlags: JSON.stringify(window.featureFlags || window.launchDarkly || {})
+            },
+            session_storage_count: Object.keys(sessionItems).length,
+            loggedIn: !document.querySelector(%s)
+        };
+    } catch (e) {
+        return {error: e.toString()};
+    }
+})()""" % json.dumps(LOGIN_SELECTOR)
+
+# Chrome flags for authentication sessions. Besides the basics, drop every
+# background service and image decoding, none of which token extraction needs
+CHROME_ARGS = (
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--window-size=1920,1080",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-sync",
+    "--disable-translate",
+    "--metrics-recording-only",
+    "--mute-audio",
+    "--no-first-run",
+    "--disable-features=TranslateUI,BlinkGenPropertyTrees",
+    "--blink-settings=imagesEnabled=false",
+    "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+)
+
+@functools.lru_cache(maxsize=2)
+def chrome_options(headless=True):
+    """Build the Chrome options for a headless or headed session once
+    
+    Args:
+        headless (bool): Whether to run browser in headless mode
+        
+    Returns:
+        Options: Shared options template; treat it as read-only
+    """
+    options = Options()
+    if headless:
+        options.add_argument("--headless")
+    for arg in CHROME_ARGS:
+        options.add_argument(arg)
+    return options
+
+# Persistent HTTP connections kept open to each chromedriver
+COMMAND_POOL_SIZE = 20
+
+# Resources the auth pages load that token extraction never needs
+BLOCKED_URL_PATTERNS = (
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.mp4", "*.webm",
+    "*google-analytics*", "*googletagmanager*", "*doubleclick*", "*segment.io*",
+)
+
+# Origins whose stored data is wiped before a pooled driver serves another user
+POOL_CLEARED_ORIGINS = ("https://replit.com",)
+
+# Issues independent WebDriver commands side by side; each is just an HTTP
+# request to chromedriver over the pooled connections
+command_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="webdriver-cmd")
+
+class BrowserPool:
+    """Thread-safe pool of warm Chrome WebDriver instances
+
+    Starting Chrome dominates the cost of an authentication, so drivers are
+    wiped and kept running between uses instead of being quit.
+    """
+    
+    def __init__(self, maxsize=None):
+        """Initialize the pool
+        
+        Args:
+            maxsize (int, optional): Idle drivers kept per mode. Defaults to $BROWSER_POOL_SIZE or 2.
+        """
+        self.maxsize = maxsize or int(os.environ.get('BROWSER_POOL_SIZE', '2'))
+        self._idle = {}  # headless flag -> queue.Queue of idle drivers
+        self._drivers = set()  # Every live driver created by the pool
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+    
+    def _idle_queue(self, headless):
+        with self._lock:
+            if headless not in self._idle:
+                self._idle[headless] = queue.Queue(maxsize=self.maxsize)
+            return self._idle[headless]
+    
+    def acquire(self, options, headless=True):
+        """Get an idle driver, or start a new one if none is available
+        
+        Args:
+            options (Options): Chrome options used if a new driver has to be started
+            headless (bool): Whether the driver runs headless
+            
+        Returns:
+            WebDriver: A clean driver
+        """
+        try:
+            driver = self._idle_queue(headless).get_nowait()
+            logger.info("Reusing pooled WebDriver")
+            return driver
+        except queue.Empty:
+            pass
+        
+        logger.info("Creating Chrome WebDriver")
+        driver = webdriver.Chrome(options=options, keep_alive=True)
+        self._configure_command_pool(driver)
+        self._block_heavy_resources(driver)
+        with self._lock:
+            self._drivers.add(driver)
+        return driver
+    
+    def _configure_command_pool(self, driver):
+        """Keep enough persistent connections open to chromedriver
+
+        Every WebDriver command is an HTTP request to chromedriver, so the
+        connection pool is rebuilt from the executor's own client config
+        with room for concurrent commands and without blocking on a full pool.
+        """
+        executor = driver.command_executor
+        try:
+            client_config = executor._client_config
+            client_config.keep_alive = True
+            client_config.init_args_for_pool_manager = {
+                **(client_config.init_args_for_pool_manager or {}),
+                'maxsize': COMMAND_POOL_SIZE,
+                'block': False,
+            }
+            executor._conn = executor._get_connection_manager()
+        except AttributeError:
+            # Older Selenium without ClientConfig
+            logger.debug("Could not resize the WebDriver connection pool")
+    
+    def _block_heavy_resources(self, driver):
+        """Stop the driver from fetching media, fonts and trackers
+
+        The block list stays on the tab for the driver's lifetime, so it is
+        set once when the pool creates the driver.
+        """
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(BLOCKED_URL_PATTERNS)})
+        except Exception as e:
+            logger.warning(f"Could not block heavy resources: {str(e)}")
+    
+    def release(self, driver, headless=True):
+        """Wipe a driver's session state and return it to the pool
+        
+        Args:
+            driver (WebDriver): Driver obtained from acquire
+            headless (bool): Whether the driver runs headless
+        """
+        try:
+            driver.execute_script("localStorage.clear(); sessionStorage.clear();")
+            driver.delete_all_cookies()
+            # delete_all_cookies only covers the current page's domain
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            
+            # IndexedDB, Cache Storage, service workers and the HTTP cache would
+            # otherwise carry over into the next user's session
+            origins = set(POOL_CLEARED_ORIGINS)
+            current_origin = driver.execute_script("return location.origin;")
+            if current_origin and current_origin.startswith("http"):
+                origins.add(current_origin)
+            for origin in origins:
+                driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+            driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+            
+            driver.get("about:blank")
+            self._idle_queue(headless).put_nowait(driver)
+        except queue.Full:
+            self.discard(driver)
+        except Exception as e:
+            logger.warning(f"Discarding WebDriver that could not be reset: {str(e)}")
+            self.discard(driver)
+    
+    def discard(self, driver):
+        """Quit a driver and forget about it"""
+        with self._lock:
+            self._drivers.discard(driver)
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.error(f"Error closing browser: {str(e)}")
+    
+    def shutdown(self):
+        """Quit every driver the pool has started"""
+        with self._lock:
+            drivers = list(self._drivers)
+            self._drivers.clear()
+            self._idle.clear()
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+browser_pool = BrowserPool()
+
 class BrowserAuthenticator:
     """Handles browser-based authentication and token extraction for Replit"""
     
@@ -25,6 +299,8 @@ class BrowserAuthenticator:
         self.headless = headless
         self.driver = None
         self.is_authenticated = False
+        self.logged_in = False  # Login state seen by the last extract_browser_state
+        self._network_monitor_id = None  # CDP identifier of the registered monitoring script
         self.auth_data = {
             'cookies': {},
             'local_storage': {},
@@ -37,21 +313,10 @@ class BrowserAuthenticator:
     def setup_browser(self):
         """Set up the browser instance"""
         logger.info("Setting up browser instance")
-        chrome_options = Options()
-        
-        if self.headless:
-            chrome_options.add_argument("--headless")
-            
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--window-size=1920,1080")
-        chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
         
         try:
-            logger.info("Creating Chrome WebDriver")
-            self.driver = webdriver.Chrome(options=chrome_options)
-            logger.info("WebDriver created successfully")
+            self.driver = browser_pool.acquire(chrome_options(self.headless), self.headless)
+            logger.info("WebDriver ready")
             return True
         except Exception as e:
             logger.error(f"Error creating WebDriver: {str(e)}")
@@ -61,181 +326,101 @@ class BrowserAuthenticator:
         """Load cookies into the browser session"""
         logger.info(f"Loading cookies from {self.cookie_file}")
         
-        # First, visit replit.com to be able to set cookies
-        self.driver.get("https://replit.com")
-        time.sleep(2)  # Wait for page to load
-        
         # Load cookies from file
-        with open(self.cookie_file, 'r') as f:
-            cookies = json.load(f)
+        with open(self.cookie_file, 'rb') as f:
+            cookies = _json_loads(f.read())
         
         # Store cookies in auth_data
         self.auth_data['cookies'] = {cookie.get('name'): cookie.get('value') 
                                      for cookie in cookies if 'name' in cookie and 'value' in cookie}
         
-        # Add cookies to browser
+        # Convert cookies to CDP format. Expiry is left out, as before, so
+        # stale timestamps in the export cannot drop a cookie on arrival
+        cdp_cookies = []
         for cookie in cookies:
-            # Skip cookies that might cause issues
-            if 'expiry' in cookie:
-                del cookie['expiry']
-            
-            try:
-                if 'domain' in cookie and ('replit.com' in cookie['domain']):
-                    # Modify cookie domain if needed
-                    if cookie['domain'].startswith('.'):
-                        cookie['domain'] = cookie['domain'][1:]
-                    self.driver.add_cookie(cookie)
-            except Exception as e:
-                logger.warning(f"Error adding cookie {cookie.get('name')}: {str(e)}")
+            if 'name' in cookie and 'value' in cookie and 'replit.com' in cookie.get('domain', ''):
+                cdp_cookie = {
+                    'name': cookie['name'],
+                    'value': cookie['value'],
+                    'domain': cookie['domain'],
+                    'path': cookie.get('path', '/'),
+                    'secure': cookie.get('secure', False),
+                    'httpOnly': cookie.get('httpOnly', False)
+                }
+                same_site = SAME_SITE_VALUES.get(str(cookie.get('sameSite', '')).lower())
+                if same_site:
+                    cdp_cookie['sameSite'] = same_site
+                cdp_cookies.append(cdp_cookie)
+        
+        # Set them all in one call; CDP does not need the domain to be loaded first
+        self._cdp("Network.setCookies", {"cookies": cdp_cookies})
         
-        logger.info("Cookies loaded successfully")
+        logger.info(f"Loaded {len(cdp_cookies)} cookies")
     
-    def extract_local_storage(self):
-        """Extract local storage data from the browser"""
-        logger.info("Extracting local storage data")
-        try:
-            local_storage = self.driver.execute_script("""
-                let items = {};
-                for (let i = 0; i < localStorage.length; i++) {
-                    const key = localStorage.key(i);
-                    items[key] = localStorage.getItem(key);
-                }
-                return items;
-            """)
-            
-            self.auth_data['local_storage'] = local_storage
-            logger.info(f"Extracted {len(local_storage)} local storage items")
-            return True
-        except Exception as e:
-            logger.error(f"Error extracting local storage: {str(e)}")
-            return False
+    def _cdp(self, cmd, params=None):
+        """Send a Chrome DevTools Protocol command over the driver's session
+
+        Args:
+            cmd (str): CDP method name
+            params (dict, optional): Command parameters
+
+        Returns:
+            dict: Command result
+        """
+        return self.driver.execute_cdp_cmd(cmd, params or {})
     
-    def extract_websocket_params(self):
-        """Extract WebSocket connection parameters"""
-        logger.info("Extracting WebSocket parameters")
+    def extract_browser_state(self):
+        """Extract cookies, storage, WebSocket parameters and feature flags
+
+        Cookies come from CDP, which also sees httpOnly ones, and everything
+        else from one Runtime.evaluate of BROWSER_STATE_JS. The two commands
+        are independent, so they run concurrently and the phase costs about
+        one round trip and a single scan of each storage area.
+
+        Returns:
+            bool: True if the state was extracted, False otherwise
+        """
+        logger.info("Extracting browser state over CDP")
+        self.logged_in = False
         try:
-            # Execute JavaScript to extract WebSocket-related data
-            websocket_params = self.driver.execute_script("""
-                // Look for WebSocket connection info in various places
-                try {
-                    // Check for WebSocket URLs in network requests
-                    const wsConnections = performance.getEntriesByType("resource")
-                        .filter(r => r.name.includes('wss://') || r.name.includes('ws://'))
-                        .map(r => r.name);
-                    
-                    // Look for connection parameters in localStorage or sessionStorage
-                    const sessionId = localStorage.getItem('sessionId') || sessionStorage.getItem('sessionId');
-                    const clientId = localStorage.getItem('clientId') || sessionStorage.getItem('clientId');
-                    const anonymousId = localStorage.getItem('anonymousId') || sessionStorage.getItem('anonymousId');
-                    
-                    return {
-                        wsUrls: wsConnections,
-                        sessionId: sessionId,
-                        clientId: clientId,
-                        anonymousId: anonymousId,
-                        // Add other parameters as they're identified
-                    };
-                } catch (e) {
-                    return {error: e.toString()};
-                }
-            """)
-            
-            self.auth_data['websocket_params'] = websocket_params
-            logger.info(f"Extracted WebSocket parameters")
-            return True
+            cookies_future = command_executor.submit(self._cdp, "Network.getAllCookies")
+            page_state_future = command_executor.submit(self._cdp, "Runtime.evaluate", {
+                "expression": BROWSER_STATE_JS,
+                "returnByValue": True
+            })
+            cookies = cookies_future.result().get('cookies', [])
+            page_state = page_state_future.result().get('result', {}).get('value') or {}
         except Exception as e:
-            logger.error(f"Error extracting WebSocket parameters: {str(e)}")
+            logger.error(f"Error extracting browser state: {str(e)}")
             return False
-    
-    def extract_feature_flags(self):
-        """Extract feature flags from the page"""
-        logger.info("Extracting feature flags")
-        try:
-            # Try to find feature flags in network requests or localStorage
-            feature_flags = self.driver.execute_script("""
-                // Look for feature flags in various sources
-                try {
-                    // Check localStorage for LaunchDarkly or feature flag data
-                    const ldData = {};
-                    for (let i = 0; i < localStorage.length; i++) {
-                        const key = localStorage.key(i);
-                        if (key.includes('LaunchDarkly') || key.includes('flag-') || key.includes('feature')) {
-                            ldData[key] = localStorage.getItem(key);
-                        }
-                    }
-                    
-                    // Check for feature flags in the window object
-                    const windowFlags = window.featureFlags || window.launchDarkly || {};
-                    
-                    return {
-                        localStorage: ldData,
-                        windowFlags: JSON.stringify(windowFlags)
-                    };
-                } catch (e) {
-                    return {error: e.toString()};
-                }
-            """)
-            
-            self.auth_data['feature_flags'] = feature_flags
-            logger.info(f"Extracted feature flags data")
-            return True
-        except Exception as e:
-            logger.error(f"Error extracting feature flags: {str(e)}")
-            return False
-    
-    def extract_session_tokens(self):
-        """Extract session tokens and authentication data"""
-        logger.info("Extracting session tokens")
-        try:
-            session_tokens = self.driver.execute_script("""
-                // Look for session tokens in various places
-                try {
-                    // Check localStorage and sessionStorage for auth tokens
-                    const authData = {};
-                    
-                    // Check localStorage
-                    for (let i = 0; i < localStorage.length; i++) {
-                        const key = localStorage.key(i);
-                        if (key.includes('token') || key.includes('auth') || 
-                            key.includes('session') || key.includes('user')) {
-                            authData[`localStorage_${key}`] = localStorage.getItem(key);
-                        }
-                    }
-                    
-                    // Check sessionStorage
-                    for (let i = 0; i < sessionStorage.length; i++) {
-                        const key = sessionStorage.key(i);
-                        if (key.includes('token') || key.includes('auth') || 
-                            key.includes('session') || key.includes('user')) {
-                            authData[`sessionStorage_${key}`] = sessionStorage.getItem(key);
-                        }
-                    }
-                    
-                    // Try to find user data
-                    const userData = window.__INITIAL_DATA__ || window.__PRELOADED_STATE__ || {};
-                    
-                    return {
-                        storage: authData,
-                        userData: JSON.stringify(userData)
-                    };
-                } catch (e) {
-                    return {error: e.toString()};
-                }
-            """)
-            
-            self.auth_data['session_tokens'] = session_tokens
-            logger.info(f"Extracted session tokens data")
-            return True
-        except Exception as e:
-            logger.error(f"Error extracting session tokens: {str(e)}")
+        
+        # Pick up cookies the page refreshed or added after loading
+        for cookie in cookies:
+            if 'replit.com' in cookie.get('domain', ''):
+                self.auth_data['cookies'][cookie['name']] = cookie['value']
+        
+        if 'error' in page_state:
+            logger.error(f"Error reading page state: {page_state['error']}")
             return False
+        
+        self.logged_in = page_state['loggedIn']
+        for key in ('local_storage', 'session_tokens', 'websocket_params', 'feature_flags'):
+            self.auth_data[key] = page_state[key]
+        
+        logger.info(f"Extracted {len(cookies)} cookies, {len(page_state['local_storage'])} local storage "
+                    f"and {page_state['session_storage_count']} session storage items")
+        return True
     
     def monitor_network_requests(self):
-        """Monitor network requests to capture WebSocket and API calls"""
+        """Monitor network requests to capture WebSocket and API calls
+        
+        The script is registered to run before page scripts on every new
+        document, so it survives the navigation that follows and sees the
+        page's own WebSocket connections.
+        """
         logger.info("Setting up network request monitoring")
         try:
-            # Execute script to set up network monitoring
-            self.driver.execute_script("""
+            result = self._cdp("Page.addScriptToEvaluateOnNewDocument", {"source": """
                 // This script sets up monitoring for network requests
                 // It will store information about WebSocket connections and API calls
                 
@@ -319,7 +504,8 @@ class BrowserAuthenticator:
                 };
                 
                 console.log('Network monitoring set up successfully');
-            """)
+            """})
+            self._network_monitor_id = result.get('identifier')
             
             logger.info("Network monitoring set up successfully")
             return True
@@ -361,51 +547,39 @@ class BrowserAuthenticator:
             logger.info("Navigating to Replit AI page")
             self.driver.get("https://replit.com/ai")
             
-            # Wait for page to load properly
-            time.sleep(5)
+            # Wait until the chat input renders instead of sleeping a fixed time
+            input_element = None
+            try:
+                input_element = WebDriverWait(self.driver, 15).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, INPUT_SELECTOR))
+                )
+            except TimeoutException:
+                logger.warning("Chat input did not appear, checking login state")
             
-            # Check if we're logged in
-            page_source = self.driver.page_source.lower()
-            if "log in" in page_source or "sign up" in page_source or "login" in page_source:
+            # Extract authentication data and check the login state in the
+            # same round trip
+            self.extract_browser_state()
+            if not self.logged_in:
                 logger.error("Not logged in - authentication failed")
                 self.is_authenticated = False
                 return False
             
-            # Extract various authentication data
-            self.extract_local_storage()
-            self.extract_websocket_params()
-            self.extract_feature_flags()
-            self.extract_session_tokens()
-            
             # Interact with the page to trigger WebSocket connections
-            try:
-                # Try to find and interact with the chat input
-                input_selectors = [
-                    "//textarea[contains(@placeholder, 'Ask')]",
-                    "//textarea[contains(@placeholder, 'Message')]",
-                    "//textarea[contains(@placeholder, 'Type')]",
-                    "//div[contains(@contenteditable, 'true')]",
-                    "//input[contains(@placeholder, 'Message')]"
-                ]
-                
-                for selector in input_selectors:
-                    try:
-                        input_element = WebDriverWait(self.driver, 3).until(
-                            EC.presence_of_element_located((By.XPATH, selector))
-                        )
-                        if input_element:
-                            logger.info(f"Found input field with selector: {selector}")
-                            # Just click on it to focus, don't send any message
-                            input_element.click()
-                            time.sleep(2)
-                            break
-                    except:
-                        continue
-            except Exception as e:
-                logger.warning(f"Could not interact with chat input: {str(e)}")
+            if input_element is not None:
+                try:
+                    # Just click on it to focus, don't send any message
+                    logger.info("Found chat input field")
+                    input_element.click()
+                except Exception as e:
+                    logger.warning(f"Could not interact with chat input: {str(e)}")
             
-            # Collect network data after page interaction
-            time.sleep(3)  # Wait for WebSocket connections to establish
+            # Collect network data once a WebSocket connection has been seen
+            try:
+                WebDriverWait(self.driver, 5, poll_frequency=0.1).until(lambda driver: driver.execute_script(
+                    "return !!(window.__network_data && window.__network_data.websocket_connections.length > 0);"
+                ))
+            except TimeoutException:
+                logger.warning("No WebSocket connection observed before collecting network data")
             self.collect_network_data()
             
             # Record authentication timestamp
@@ -416,8 +590,7 @@ class BrowserAuthenticator:
             return True
             
         except Exception as e:
-            logger.error(f"Authentication process failed: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception(f"Authentication process failed: {str(e)}")
             self.is_authenticated = False
             return False
     
@@ -431,9 +604,13 @@ class BrowserAuthenticator:
     def close(self):
         """Close the browser session"""
         if self.driver:
-            logger.info("Closing browser session")
-            try:
-                self.driver.quit()
-                self.driver = None
-            except Exception as e:
-                logger.error(f"Error closing browser: {str(e)}")
\ No newline at end of file
+            if self._network_monitor_id is not None:
+                # The driver is reused, so the script must not run for the next user
+                try:
+                    self._cdp("Page.removeScriptToEvaluateOnNewDocument", {"identifier": self._network_monitor_id})
+                except Exception as e:
+                    logger.warning(f"Could not remove network monitoring script: {str(e)}")
+                self._network_monitor_id = None
+            logger.info("Returning browser session to the pool")
+            browser_pool.release(self.driver, self.headless)
+            self.driver = None
\ No newline at end of file
@@ -2,13 +2,87 @@ import os
 import json
 import time
 import base64
+import hashlib
 import logging
+import functools
+import threading
+from collections import OrderedDict
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj):
+        # json.dumps stringifies non-str keys, so keep that behaviour
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj):
+        return json.dumps(obj).encode()
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
 logger = logging.getLogger(__name__)
 
+KDF_SALT = b'replit_agent_bot_salt'  # Not ideal, but ok for this use case
+KDF_ITERATIONS = 100000
+
+TOKEN_CACHE_SIZE = 256  # Decrypted users kept in memory
+VALIDITY_TTL_NS = 30 * 1_000_000_000  # How long a negative is_token_valid answer is reused
+
+# Token files written with AES-GCM start with a format byte. Older Fernet
+# files start with base64 text ("gAAAAA"), so they can never be confused.
+AESGCM_FORMAT = b'\x01'  # Plain JSON
+AESGCM_ZSTD_FORMAT = b'\x02'  # zstd-compressed JSON
+NONCE_SIZE = 12
+ZSTD_LEVEL = 3
+
+@functools.lru_cache(maxsize=8)
+def _derive_fernet_key(password):
+    """Derive a Fernet key from a password with PBKDF2-HMAC-SHA256
+    
+    Args:
+        password (bytes): Password to derive the key from
+        
+    Returns:
+        bytes: URL-safe base64 encoded 32-byte key
+    """
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=KDF_SALT,
+        iterations=KDF_ITERATIONS,
+    )
+    return base64.urlsafe_b64encode(kdf.derive(password))
+
+_prepared_dirs = set()  # Storage directories already created by this process
+_prepared_dirs_lock = threading.Lock()
+
+def _prepare_storage_dir(path):
+    """Create a storage directory the first time it is used in this process
+    
+    Args:
+        path (str): Directory to create
+        
+    Returns:
+        bool: True if this was the first use of the directory
+    """
+    with _prepared_dirs_lock:
+        if path in _prepared_dirs:
+            return False
+        os.makedirs(path, exist_ok=True)
+        _prepared_dirs.add(path)
+        return True
+
 class TokenManager:
     """Securely manages authentication tokens and credentials"""
     
@@ -20,10 +94,11 @@ class TokenManager:
             encryption_key (str): Key for encrypting token data. If None, generates one.
         """
         self.storage_dir = storage_dir
-        self.tokens_file = os.path.join(storage_dir, "tokens.enc")
+        self.tokens_file = os.path.join(storage_dir, "tokens.enc")  # Legacy single-file store
+        self.users_dir = os.path.join(storage_dir, "users")
         
-        # Ensure storage directory exists
-        os.makedirs(storage_dir, exist_ok=True)
+        # Ensure storage directories exist, once per process
+        first_use = _prepare_storage_dir(self.users_dir)
         
         # Setup encryption
         if encryption_key is None:
@@ -35,9 +110,14 @@ class TokenManager:
         
         self.setup_encryption(encryption_key)
         
-        # Initialize tokens storage
-        self.tokens = {}
-        self.load_tokens()
+        # Most recently used users, filled on demand from their own files
+        self.tokens = OrderedDict()
+        self._validity = {}  # (user_id, max_age) -> (expiry, recheck_at), monotonic ns
+        self._lock = threading.Lock()
+        
+        # Only the first manager on a directory needs to look for a legacy store
+        if first_use:
+            self.load_tokens()
     
     def setup_encryption(self, key):
         """Set up encryption with the provided key"""
@@ -46,49 +126,201 @@ class TokenManager:
             if isinstance(key, str):
                 # If key is a password rather than a Fernet key, derive a key
                 if not key.endswith('='):  # Heuristic to detect if it's not a base64 key
-                    password = key.encode()
-                    salt = b'replit_agent_bot_salt'  # Not ideal, but ok for this use case
-                    kdf = PBKDF2HMAC(
-                        algorithm=hashes.SHA256(),
-                        length=32,
-                        salt=salt,
-                        iterations=100000,
-                    )
-                    key = base64.urlsafe_b64encode(kdf.derive(password))
+                    key = self._get_derived_key(key.encode())
                 else:
                     key = key.encode()
             
-            self.cipher = Fernet(key)
+            # The 32 bytes behind the Fernet-style key become an AES-256-GCM
+            # key; Fernet is kept only to read files written before the switch
+            self.cipher = AESGCM(base64.urlsafe_b64decode(key))
+            self.legacy_cipher = Fernet(key)
             logger.info("Encryption setup successful")
         except Exception as e:
             logger.error(f"Failed to setup encryption: {str(e)}")
             raise
     
+    def _encrypt(self, plaintext):
+        """Encrypt data with AES-GCM, compressing it first when zstd is available
+        
+        Auth data is mostly repetitive JSON, so compressing it shrinks the
+        bytes that have to be encrypted and written several times over.
+        
+        Args:
+            plaintext (bytes): Data to encrypt
+            
+        Returns:
+            bytes: Format byte, nonce and ciphertext with its tag
+        """
+        if HAS_ZSTD:
+            file_format = AESGCM_ZSTD_FORMAT
+            plaintext = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(plaintext)
+        else:
+            file_format = AESGCM_FORMAT
+        
+        nonce = os.urandom(NONCE_SIZE)
+        return file_format + nonce + self.cipher.encrypt(nonce, plaintext, None)
+    
+    def _decrypt(self, data):
+        """Decrypt data written by _encrypt, or by Fernet before it
+        
+        Args:
+            data (bytes): Encrypted data
+            
+        Returns:
+            bytes: Decrypted data
+        """
+        file_format = data[:1]
+        if file_format in (AESGCM_FORMAT, AESGCM_ZSTD_FORMAT):
+            nonce = data[1:1 + NONCE_SIZE]
+            plaintext = self.cipher.decrypt(nonce, data[1 + NONCE_SIZE:], None)
+            if file_format == AESGCM_ZSTD_FORMAT:
+                if not HAS_ZSTD:
+                    raise ValueError("Token file is zstd-compressed but zstandard is not installed")
+                plaintext = zstandard.ZstdDecompressor().decompress(plaintext)
+            return plaintext
+        return self.legacy_cipher.decrypt(data)
+    
+    def _get_derived_key(self, password):
+        """Get the key derived from a password, skipping PBKDF2 when possible
+        
+        Derived keys are memoized per process. With TOKEN_KEY_CACHE=1 they are
+        also kept in storage_dir/.keycache so restarts skip the derivation;
+        that file holds the key itself, so it is opt-in and written 0600.
+        
+        Args:
+            password (bytes): Password to derive the key from
+            
+        Returns:
+            bytes: Fernet key
+        """
+        if os.getenv("TOKEN_KEY_CACHE", "") != "1":
+            return _derive_fernet_key(password)
+        
+        cache_file = os.path.join(self.storage_dir, ".keycache")
+        fingerprint = hashlib.sha256(password).hexdigest()[:8]
+        
+        try:
+            with open(cache_file, 'r') as f:
+                cached_fingerprint, cached_key = f.read().split(':', 1)
+            if cached_fingerprint == fingerprint:
+                return cached_key.strip().encode()
+        except (OSError, ValueError):
+            pass
+        
+        key = _derive_fernet_key(password)
+        try:
+            fd = os.open(cache_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                f.write(f"{fingerprint}:{key.decode()}")
+        except OSError as e:
+            logger.warning(f"Failed to write key cache: {str(e)}")
+        return key
+    
+    def _user_file(self, user_id):
+        """Get the path of a user's token file
+        
+        Args:
+            user_id (str): Telegram user ID
+            
+        Returns:
+            str: Path named after a hash of the ID, so IDs never reach the filesystem
+        """
+        digest = hashlib.sha256(str(user_id).encode()).hexdigest()
+        return os.path.join(self.users_dir, f"{digest}.enc")
+    
+    def _read_user(self, user_id):
+        """Read and decrypt a user's token file
+        
+        Args:
+            user_id (str): Telegram user ID
+            
+        Returns:
+            dict: Stored entry with 'data' and 'stored_at', or None if not found
+        """
+        try:
+            with open(self._user_file(user_id), 'rb') as f:
+                encrypted_data = f.read()
+        except FileNotFoundError:
+            return None
+        
+        try:
+            return _json_loads(self._decrypt(encrypted_data))
+        except Exception as e:
+            logger.error(f"Failed to load tokens for user {user_id}: {str(e)}")
+            return None
+    
+    def _write_user(self, user_id, entry):
+        """Encrypt and atomically write a user's token file
+        
+        Args:
+            user_id (str): Telegram user ID
+            entry (dict): Entry with 'data' and 'stored_at'
+        """
+        path = self._user_file(user_id)
+        tmp_path = f"{path}.tmp"
+        encrypted_data = self._encrypt(_json_dumps(entry))
+        
+        with open(tmp_path, 'wb') as f:
+            f.write(encrypted_data)
+        os.replace(tmp_path, path)
+    
+    def _get_entry(self, user_id):
+        """Get a user's stored entry, loading it from disk on a cache miss"""
+        with self._lock:
+            entry = self.tokens.get(user_id)
+            if entry is not None:
+                self.tokens.move_to_end(user_id)
+                return entry
+        
+        entry = self._read_user(user_id)
+        if entry is not None:
+            self._cache_entry(user_id, entry)
+        return entry
+    
+    def _cache_entry(self, user_id, entry):
+        """Keep a user's entry in memory, evicting the least recently used"""
+        with self._lock:
+            self.tokens[user_id] = entry
+            self.tokens.move_to_end(user_id)
+            while len(self.tokens) > TOKEN_CACHE_SIZE:
+                self.tokens.popitem(last=False)
+    
+    def _invalidate(self, user_id):
+        """Drop everything cached for a user"""
+        with self._lock:
+            self.tokens.pop(user_id, None)
+            for key in [key for key in self._validity if key[0] == user_id]:
+                del self._validity[key]
+    
     def load_tokens(self):
-        """Load tokens from storage file"""
+        """Migrate the legacy single-file store to per-user files
+        
+        Users are otherwise loaded lazily by _get_entry, so startup no longer
+        decrypts every user's tokens.
+        """
         if not os.path.exists(self.tokens_file):
-            logger.info(f"No tokens file found at {self.tokens_file}")
             return
         
         try:
             with open(self.tokens_file, 'rb') as f:
                 encrypted_data = f.read()
             
-            decrypted_data = self.cipher.decrypt(encrypted_data)
-            self.tokens = json.loads(decrypted_data.decode())
-            logger.info(f"Loaded tokens for {len(self.tokens)} users")
+            legacy_tokens = _json_loads(self._decrypt(encrypted_data))
+            for user_id, entry in legacy_tokens.items():
+                self._write_user(user_id, entry)
+            
+            os.replace(self.tokens_file, f"{self.tokens_file}.migrated")
+            logger.info(f"Migrated tokens for {len(legacy_tokens)} users to per-user files")
         except Exception as e:
-            logger.error(f"Failed to load tokens: {str(e)}")
-            self.tokens = {}
+            logger.error(f"Failed to migrate tokens: {str(e)}")
     
     def save_tokens(self):
-        """Save tokens to storage file"""
+        """Save every loaded user's tokens to their files"""
         try:
-            json_data = json.dumps(self.tokens)
-            encrypted_data = self.cipher.encrypt(json_data.encode())
-            
-            with open(self.tokens_file, 'wb') as f:
-                f.write(encrypted_data)
+            with self._lock:
+                entries = list(self.tokens.items())
+            for user_id, entry in entries:
+                self._write_user(user_id, entry)
             
             logger.info(f"Saved tokens for {len(self.tokens)} users")
             return True
@@ -105,11 +337,14 @@ class TokenManager:
         """
         try:
             # Store with timestamp
-            self.tokens[user_id] = {
+            entry = {
                 'data': auth_data,
-                'stored_at': int(time.time())
+                'stored_at': time.time_ns() // 1_000_000_000
             }
-            return self.save_tokens()
+            self._write_user(user_id, entry)
+            self._invalidate(user_id)
+            self._cache_entry(user_id, entry)
+            return True
         except Exception as e:
             logger.error(f"Failed to store tokens for user {user_id}: {str(e)}")
             return False
@@ -123,7 +358,7 @@ class TokenManager:
         Returns:
             dict: Authentication data or None if not found
         """
-        user_data = self.tokens.get(user_id)
+        user_data = self._get_entry(user_id)
         if not user_data:
             logger.warning(f"No tokens found for user {user_id}")
             return None
@@ -140,14 +375,28 @@ class TokenManager:
         Returns:
             bool: True if tokens exist and are valid, False otherwise
         """
-        user_data = self.tokens.get(user_id)
-        if not user_data:
-            return False
+        key = (user_id, max_age)
+        now = time.monotonic_ns()
         
-        stored_at = user_data.get('stored_at', 0)
-        current_time = int(time.time())
+        # Tokens expire at a fixed point on the monotonic clock, so once that
+        # point is known a check is a single integer comparison
+        with self._lock:
+            cached = self._validity.get(key)
+        if cached is not None and now < cached[1]:
+            return now < cached[0]
+        
+        user_data = self._get_entry(user_id)
+        if not user_data:
+            expiry = 0
+        else:
+            age_ns = time.time_ns() - user_data.get('stored_at', 0) * 1_000_000_000
+            expiry = now + max_age * 1_000_000_000 - age_ns
         
-        return (current_time - stored_at) < max_age
+        # Valid tokens are trusted until they expire; missing or expired ones
+        # are looked up again after a short while in case they were refreshed
+        with self._lock:
+            self._validity[key] = (expiry, max(expiry, now + VALIDITY_TTL_NS))
+        return now < expiry
     
     def delete_user_tokens(self, user_id):
         """Delete tokens for a specific user
@@ -158,8 +407,12 @@ class TokenManager:
         Returns:
             bool: True if deleted, False otherwise
         """
-        if user_id in self.tokens:
-            del self.tokens[user_id]
-            return self.save_tokens()
-        
-        return False
\ No newline at end of file
+        self._invalidate(user_id)
+        try:
+            os.remove(self._user_file(user_id))
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.error(f"Failed to delete tokens for user {user_id}: {str(e)}")
+            return False
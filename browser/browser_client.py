@@ -1,36 +1,281 @@
 import os
 import json
 import time
+import queue
+import atexit
 import asyncio
 import logging
-import traceback
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.keys import Keys
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 logger = logging.getLogger(__name__)
 
+# The response is considered fully rendered once the DOM has been idle this long
+QUIESCENCE_MS = 300
+# Upper bound on how long to wait for the DOM to settle after a response appears
+QUIESCENCE_TIMEOUT = 30
+
+# CDP expects capitalized sameSite values; exports use various spellings
+SAME_SITE_VALUES = {'strict': 'Strict', 'lax': 'Lax', 'none': 'None', 'no_restriction': 'None'}
+
+CHROME_ARGS = (
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--window-size=1920,1080",
+    # Only the response text is read, so skip everything that just renders or phones home
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-sync",
+    "--disable-features=TranslateUI,MediaRouter",
+    "--blink-settings=imagesEnabled=false",
+    "--disable-blink-features=AutomationControlled",
+    "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+)
+
+# Block images at the content-settings level too, so they are never fetched
+CHROME_PREFS = {"profile.managed_default_content_settings.images": 2}
+
+# Focuses an element and selects its contents
+SELECT_CONTENTS_JS = """
+const e = arguments[0];
+e.focus();
+if (typeof e.select === 'function') e.select(); else document.execCommand('selectAll');
+"""
+
+# True when the page shows a login link or "Log in" / "Sign in" text
+LOGGED_OUT_JS = """
+if (document.querySelector("a[href*='/login'], button[data-cy='login'], button[data-testid='login']")) return true;
+return /(?:Log|Sign)\\s*in/.test(document.body ? document.body.innerText : '');
+"""
+
+# Seconds extracted auth data is reused before reading it from the browser again
+AUTH_DATA_TTL = 300
+
+# Auth extractions run here so callers on any event loop can share one in progress
+extraction_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="auth-extract")
+
+# How long to wait for a pooled browser client when every slot is busy
+POOL_ACQUIRE_TIMEOUT = 120
+
+# Number of WebSocket messages kept by the in-page traffic monitor
+MAX_WS_MESSAGES = 200
+
+# WebSocket traffic monitor and DOM mutation tracker. Registered to run before
+# any page script so the connection opened during page load is captured too;
+# the guard keeps it from wrapping WebSocket twice.
+WS_HOOK_JS = """
+(function(maxMessages) {
+    if (window.__ws_traffic) return;
+
+    // Store WebSocket traffic information
+    window.__ws_traffic = {
+        connections: [],
+        messages: [],
+        enabled: true
+    };
+
+    // Keep only the most recent text messages; binary frames are never needed,
+    // and recording stops once the connection parameters have been extracted
+    const recordMessage = function(direction, data) {
+        if (!window.__ws_traffic.enabled || typeof data !== 'string') return;
+        const messages = window.__ws_traffic.messages;
+        messages.push({direction: direction, data: data, time: new Date().toISOString()});
+        if (messages.length > maxMessages) messages.shift();
+    };
+
+    // Remember the session parameters from the latest handshake-like message
+    const captureConnParams = function(data) {
+        if (typeof data !== 'string' || data.indexOf('clientId') < 0) return;
+        const parsed = JSON.parse(data);
+        if (parsed && parsed.clientId && parsed.sessionId) {
+            window.__conn_params = {
+                clientId: parsed.clientId,
+                sessionId: parsed.sessionId,
+                tokenCluster: parsed.tokenCluster || 'picard'
+            };
+        }
+    };
+
+    // Override WebSocket to monitor traffic
+    const originalWebSocket = window.WebSocket;
+    window.WebSocket = function(url, protocols) {
+        console.log('WebSocket connection to:', url);
+
+        // Create actual WebSocket
+        const ws = new originalWebSocket(url, protocols);
+
+        // Log connection
+        window.__ws_traffic.connections.push({
+            url: url,
+            protocols: protocols,
+            time: new Date().toISOString()
+        });
+
+        // Monitor send method
+        const originalSend = ws.send;
+        ws.send = function(data) {
+            try {
+                recordMessage('outgoing', data);
+                captureConnParams(data);
+            } catch (e) {
+                console.error('Error logging WebSocket send:', e);
+            }
+
+            return originalSend.apply(this, arguments);
+        };
+
+        // Monitor incoming messages
+        ws.addEventListener('message', function(event) {
+            try {
+                recordMessage('incoming', event.data);
+            } catch (e) {
+                console.error('Error logging WebSocket message:', e);
+            }
+        });
+
+        return ws;
+    };
+
+    // Keep instanceof checks and the readyState constants working for page code
+    window.WebSocket.prototype = originalWebSocket.prototype;
+    ['CONNECTING', 'OPEN', 'CLOSING', 'CLOSED'].forEach(k => { window.WebSocket[k] = originalWebSocket[k]; });
+
+    // Track the last DOM mutation so callers can wait for rendering to settle
+    window.__lastMut = Date.now();
+    new MutationObserver(() => { window.__lastMut = Date.now(); }).observe(
+        document, {subtree: true, childList: true, characterData: true}
+    );
+
+    console.log('WebSocket monitoring set up');
+})(%d);
+""" % MAX_WS_MESSAGES
+
+# Selectors that may match an agent response
+RESPONSE_SELECTORS = [
+    ".agent-response",
+    ".message.response",
+    ".message:not(.user-message)",
+    ".response-container",
+    "[data-testid='ai-response']"
+]
+# Matches any of the response selectors so a single wait covers them all
+RESPONSE_SELECTOR = ", ".join(RESPONSE_SELECTORS)
+
+# Selectors for the prompt input, in order of preference
+INPUT_SELECTORS = [
+    "textarea",
+    "input[type='text']",
+    "textarea[placeholder*='Ask']",
+    "textarea[placeholder*='Message']",
+    "textarea[placeholder*='Type']",
+    "div[contenteditable*='true']",
+    "input[placeholder*='Message']"
+]
+
+# Selectors for the submit button, in order of preference
+SUBMIT_SELECTORS = [
+    "button[type='submit']",
+    "button.send-button",
+    "button:has(svg)",  # Button with an SVG icon
+    "div.input-area button",  # Button in an input area
+    "form button"  # Button within a form
+]
+
+# Returns [element, selector] for the first visible (and, if requested, enabled) match
+QUERY_FIRST_JS = """
+const [selectors, enabledOnly] = arguments;
+for (const s of selectors) {
+    let elements;
+    try { elements = document.querySelectorAll(s); } catch (e) { continue; }
+    for (const e of elements) {
+        if (e.offsetParent !== null && !(enabledOnly && e.disabled)) return [e, s];
+    }
+}
+return null;
+"""
+
 class ReplitBrowserClient:
     """Client for interacting with Replit agent through browser automation"""
     
-    def __init__(self, cookies_file=None, headless=True):
+    def __init__(self, cookies_file=None, headless=True, profile_dir=None):
         """Initialize the browser client
         
         Args:
             cookies_file (str, optional): Path to the cookies file
             headless (bool): Whether to run the browser in headless mode
+            profile_dir (str, optional): Chrome user data directory kept across restarts
         """
         self.cookies_file = cookies_file
         self.headless = headless
+        self.profile_dir = profile_dir or os.environ.get('BROWSER_PROFILE_DIR', './storage/browser_profile')
         self.driver = None
         self.initialized = False
         self.REPLIT_URL = "https://replit.com/ai"
         self.last_extraction_time = 0
         self.auth_data = None
+        # Selectors that matched last time; the page layout is stable within a session
+        self._input_selector = None
+        self._submit_selector = None
+        self._hooks_on_new_document = False
+        self._send_lock = None
+        self._extraction = None  # Future of the extraction in progress
+        self._extraction_lock = threading.Lock()
+        # Set when the client belongs to a BrowserClientPool
+        self.pool_slot = None
+        # A chromedriver session handles one command at a time
+        self._driver_lock = threading.Lock()
+    
+    def _locked_call(self, fn, *args, **kwargs):
+        """Run a driver call while holding the driver lock"""
+        with self._driver_lock:
+            return fn(*args, **kwargs)
+    
+    async def _call(self, fn, *args, **kwargs):
+        """Run a blocking driver call in a worker thread
+        
+        Args:
+            fn (callable): Blocking function that talks to the driver
+            
+        Returns:
+            The return value of fn
+        """
+        return await asyncio.to_thread(self._locked_call, fn, *args, **kwargs)
+    
+    def _chrome_options(self):
+        """Build the Chrome options for this client
+        
+        Returns:
+            Options: Chrome options
+        """
+        # Configure Chrome options for headless operation
+        chrome_options = Options()
+        if self.headless:
+            chrome_options.add_argument("--headless")
+        for arg in CHROME_ARGS:
+            chrome_options.add_argument(arg)
+        chrome_options.add_experimental_option("prefs", CHROME_PREFS)
+        # Return from navigation at DOMContentLoaded; the explicit waits cover the rest
+        chrome_options.page_load_strategy = "eager"
+        
+        # Keep cookies and local storage in a persistent profile
+        profile_dir = os.path.abspath(self.profile_dir)
+        os.makedirs(profile_dir, exist_ok=True)
+        chrome_options.add_argument(f"--user-data-dir={profile_dir}")
+        return chrome_options
     
     async def start(self):
         """Start the browser session"""
@@ -40,42 +285,39 @@ class ReplitBrowserClient:
         
         logger.info("Initializing browser client...")
         
-        # Configure Chrome options for headless operation
-        chrome_options = Options()
-        if self.headless:
-            chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--window-size=1920,1080")
-        chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-        
         try:
-            # Initialize the Chrome driver
-            self.driver = webdriver.Chrome(options=chrome_options)
-            
-            # Load cookies if available
-            if self.cookies_file and os.path.exists(self.cookies_file):
+            # Reuse the driver left by a failed start instead of launching another
+            if self.driver is None:
+                self.driver = await asyncio.to_thread(webdriver.Chrome, options=self._chrome_options())
+                atexit.register(self.close)
+                self._hooks_on_new_document = await self._call(self._install_network_hooks)
+            
+            # Import cookies only when the profile has no session of its own yet
+            if self._profile_has_session():
+                logger.info(f"Reusing browser session from {self.profile_dir}")
+            elif self.cookies_file and os.path.exists(self.cookies_file):
                 await self._load_cookies()
             
             # Navigate to Replit Agent
             logger.info(f"Navigating to {self.REPLIT_URL}...")
-            self.driver.get(self.REPLIT_URL)
+            await self._call(self.driver.get, self.REPLIT_URL)
+            self._input_selector = self._submit_selector = None
             
             # Wait for the page to load
             try:
-                WebDriverWait(self.driver, 20).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='text'], textarea"))
-                )
+                await self._call(self._wait_for_input)
             except TimeoutException:
                 # If we can't find the input, check if we need to log in
-                if "Log in" in self.driver.page_source or "Sign in" in self.driver.page_source:
+                # Checked in the page so the DOM is never serialized back to us
+                logged_out = await self._call(self.driver.execute_script, LOGGED_OUT_JS)
+                if logged_out:
                     logger.error("Authentication required - not logged in")
                     self.initialized = False
                     return False
             
-            # Setup monitoring for network requests
-            self._setup_network_monitoring()
+            # Setup monitoring for network requests if it could not be registered up front
+            if not self._hooks_on_new_document:
+                await self._call(self._setup_network_monitoring)
             
             logger.info("Browser client initialized successfully")
             self.initialized = True
@@ -86,14 +328,38 @@ class ReplitBrowserClient:
             return True
         
         except Exception as e:
-            logger.error(f"Failed to initialize browser client: {e}")
-            logger.error(traceback.format_exc())
+            logger.exception(f"Failed to initialize browser client: {e}")
             if self.driver:
-                self.driver.quit()
-                self.driver = None
+                await asyncio.to_thread(self.close)
             self.initialized = False
             return False
     
+    def _wait_for_input(self, timeout=20):
+        """Wait until the page shows a text input"""
+        WebDriverWait(self.driver, timeout).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='text'], textarea"))
+        )
+    
+    def _reload(self):
+        """Reload the current page and wait for the input to come back"""
+        self.driver.refresh()
+        self._input_selector = self._submit_selector = None
+        if not self._hooks_on_new_document:
+            self._setup_network_monitoring()
+        self._wait_for_input()
+    
+    def _profile_has_session(self):
+        """Check whether the browser profile already holds a cookie store
+        
+        Returns:
+            bool: True if cookies were persisted by a previous run
+        """
+        # Newer Chrome versions keep the cookie store under Default/Network
+        return any(
+            os.path.exists(os.path.join(self.profile_dir, 'Default', *parts))
+            for parts in (('Network', 'Cookies'), ('Cookies',))
+        )
+    
     async def _load_cookies(self):
         """Load cookies from file into the browser session"""
         if not self.driver:
@@ -103,115 +369,102 @@ class ReplitBrowserClient:
         try:
             logger.info(f"Loading cookies from {self.cookies_file}")
             
-            # First visit the domain to set cookies
-            self.driver.get("https://replit.com")
-            time.sleep(2)  # Wait for page to load
-            
             # Load cookies from file
-            with open(self.cookies_file, 'r') as f:
-                cookies = json.load(f)
+            with open(self.cookies_file, 'rb') as f:
+                cookies = _json_loads(f.read())
             
-            # Add cookies to browser
-            for cookie in cookies:
-                # Skip cookies that might cause issues
-                if 'expiry' in cookie:
-                    del cookie['expiry']
-                
-                try:
-                    if 'domain' in cookie and ('replit.com' in cookie['domain']):
-                        # Modify cookie domain if needed
-                        if cookie['domain'].startswith('.'):
-                            cookie['domain'] = cookie['domain'][1:]
-                        self.driver.add_cookie(cookie)
-                except Exception as e:
-                    logger.warning(f"Error adding cookie {cookie.get('name')}: {str(e)}")
+            # Set them all in one CDP call; the domain does not need to be loaded first
+            cdp_cookies = self._to_cdp_cookies(cookies)
+            await self._call(self.driver.execute_cdp_cmd, "Network.setCookies", {"cookies": cdp_cookies})
             
-            logger.info("Cookies loaded successfully")
+            logger.info(f"Loaded {len(cdp_cookies)} cookies")
             return True
         except Exception as e:
             logger.error(f"Error loading cookies: {str(e)}")
             return False
     
+    @staticmethod
+    def _to_cdp_cookies(cookies):
+        """Convert exported Replit cookies to CDP cookie parameters
+        
+        Args:
+            cookies (list): Cookie dictionaries loaded from the cookies file
+            
+        Returns:
+            list: Cookies in the format accepted by Network.setCookies
+        """
+        cdp_cookies = []
+        for cookie in cookies:
+            # Expiry is skipped, as stale timestamps would drop the cookie on arrival
+            if 'name' in cookie and 'value' in cookie and 'replit.com' in cookie.get('domain', ''):
+                cdp_cookie = {
+                    'name': cookie['name'],
+                    'value': cookie['value'],
+                    'domain': cookie['domain'],
+                    'path': cookie.get('path', '/'),
+                    'secure': cookie.get('secure', False),
+                    'httpOnly': cookie.get('httpOnly', False)
+                }
+                same_site = SAME_SITE_VALUES.get(str(cookie.get('sameSite', '')).lower())
+                if same_site:
+                    cdp_cookie['sameSite'] = same_site
+                cdp_cookies.append(cdp_cookie)
+        return cdp_cookies
+    
+    def _install_network_hooks(self):
+        """Register the monitoring script to run before page scripts on every document
+        
+        Returns:
+            bool: True if the script was registered
+        """
+        try:
+            self.driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": WS_HOOK_JS})
+            return True
+        except Exception as e:
+            logger.warning(f"Could not register network monitoring script: {str(e)}")
+            return False
+    
     def _setup_network_monitoring(self):
-        """Set up monitoring of network requests in the browser"""
+        """Set up monitoring of network requests in the current page"""
         if not self.driver:
             return
         
         try:
-            self.driver.execute_script("""
-                // Store WebSocket traffic information
-                window.__ws_traffic = {
-                    connections: [],
-                    messages: []
-                };
-                
-                // Override WebSocket to monitor traffic
-                const originalWebSocket = window.WebSocket;
-                window.WebSocket = function(url, protocols) {
-                    console.log('WebSocket connection to:', url);
-                    
-                    // Create actual WebSocket
-                    const ws = new originalWebSocket(url, protocols);
-                    
-                    // Log connection
-                    window.__ws_traffic.connections.push({
-                        url: url,
-                        protocols: protocols,
-                        time: new Date().toISOString()
-                    });
-                    
-                    // Monitor send method
-                    const originalSend = ws.send;
-                    ws.send = function(data) {
-                        try {
-                            window.__ws_traffic.messages.push({
-                                direction: 'outgoing',
-                                data: typeof data === 'string' ? data : '[binary data]',
-                                time: new Date().toISOString()
-                            });
-                            console.log('WS SEND:', typeof data === 'string' ? data : '[binary data]');
-                        } catch (e) {
-                            console.error('Error logging WebSocket send:', e);
-                        }
-                        
-                        return originalSend.apply(this, arguments);
-                    };
-                    
-                    // Monitor incoming messages
-                    ws.addEventListener('message', function(event) {
-                        try {
-                            window.__ws_traffic.messages.push({
-                                direction: 'incoming',
-                                data: typeof event.data === 'string' ? event.data : '[binary data]',
-                                time: new Date().toISOString()
-                            });
-                            console.log('WS RECEIVE:', typeof event.data === 'string' ? event.data : '[binary data]');
-                        } catch (e) {
-                            console.error('Error logging WebSocket message:', e);
-                        }
-                    });
-                    
-                    return ws;
-                };
-                
-                console.log('WebSocket monitoring set up');
-            """)
+            self.driver.execute_script(WS_HOOK_JS)
             logger.info("Network monitoring set up successfully")
         except Exception as e:
             logger.error(f"Error setting up network monitoring: {str(e)}")
     
     async def extract_auth_data(self):
-        """Extract authentication data from the browser session"""
+        """Extract authentication data from the browser session
+        
+        Concurrent callers share a single extraction in progress.
+        
+        Returns:
+            dict: Authentication data, or None on failure
+        """
         if not self.initialized or not self.driver:
             logger.error("Browser not initialized")
             return None
         
         # Only extract once per 5 minutes to avoid excessive processing
-        current_time = time.time()
-        if self.auth_data and current_time - self.last_extraction_time < 300:
+        if self.auth_data and time.monotonic() - self.last_extraction_time < AUTH_DATA_TTL:
             logger.info("Using cached auth data (extracted less than 5 minutes ago)")
             return self.auth_data
         
+        # A concurrent future can be awaited from whichever event loop the caller runs on
+        with self._extraction_lock:
+            if self._extraction is None or self._extraction.done():
+                self._extraction = extraction_executor.submit(self._extract_auth_data)
+            extraction = self._extraction
+        return await asyncio.wrap_future(extraction)
+    
+    def _extract_auth_data(self):
+        """Read cookies, localStorage and WebSocket parameters from the browser
+        
+        Returns:
+            dict: Authentication data, or None on failure
+        """
         try:
             logger.info("Extracting authentication data from browser")
             
@@ -223,52 +476,155 @@ class ReplitBrowserClient:
                 'timestamp': int(time.time())
             }
             
-            # Extract cookies
-            cookies = self.driver.get_cookies()
-            auth_data['cookies'] = {cookie['name']: cookie['value'] for cookie in cookies}
-            
-            # Extract localStorage data
-            local_storage = self.driver.execute_script("""
-                let items = {};
-                for (let i = 0; i < localStorage.length; i++) {
-                    const key = localStorage.key(i);
-                    items[key] = localStorage.getItem(key);
-                }
-                return items;
-            """)
-            auth_data['local_storage'] = local_storage
+            with self._driver_lock:
+                # Extract cookies
+                result = self.driver.execute_cdp_cmd("Network.getAllCookies", {})
+                
+                # Extract localStorage data
+                # Serialized in the page so it crosses the driver as a single string
+                local_storage = self.driver.execute_script("""
+                    let items = {};
+                    for (let i = 0; i < localStorage.length; i++) {
+                        const key = localStorage.key(i);
+                        items[key] = localStorage.getItem(key);
+                    }
+                    return JSON.stringify(items);
+                """)
+                
+                # Extract WebSocket traffic data
+                ws_traffic = self.driver.execute_script("""
+                    if (!window.__ws_traffic) return 'null';
+                    // Nothing else reads the message log, so stop growing it
+                    if (window.__conn_params) {
+                        window.__ws_traffic.enabled = false;
+                        window.__ws_traffic.messages.length = 0;
+                    }
+                    return JSON.stringify({connections: window.__ws_traffic.connections, connParams: window.__conn_params || null});
+                """)
+            
+            auth_data['cookies'] = {
+                cookie['name']: cookie['value'] for cookie in result['cookies']
+                if 'replit.com' in cookie['domain']
+            }
+            auth_data['local_storage'] = json.loads(local_storage)
             
-            # Extract WebSocket traffic data
-            ws_traffic = self.driver.execute_script("return window.__ws_traffic;")
+            ws_traffic = json.loads(ws_traffic)
             if ws_traffic:
+                # Connection parameters are parsed in the page as messages are sent
+                conn_params = ws_traffic.pop('connParams')
                 auth_data['websocket_data'] = ws_traffic
-                
-                # Extract WebSocket connection parameters
-                for msg in ws_traffic.get('messages', []):
-                    if msg.get('direction') == 'outgoing' and isinstance(msg.get('data'), str):
-                        try:
-                            data = json.loads(msg['data'])
-                            if 'clientId' in data and 'sessionId' in data:
-                                auth_data['connection_params'] = {
-                                    'clientId': data['clientId'],
-                                    'sessionId': data['sessionId'],
-                                    'tokenCluster': data.get('tokenCluster', 'picard')
-                                }
-                                break
-                        except:
-                            pass
+                if conn_params:
+                    auth_data['connection_params'] = conn_params
             
             self.auth_data = auth_data
-            self.last_extraction_time = current_time
+            self.last_extraction_time = time.monotonic()
             logger.info(f"Extracted {len(auth_data['cookies'])} cookies and {len(auth_data['local_storage'])} localStorage items")
             
             return auth_data
         
         except Exception as e:
-            logger.error(f"Error extracting auth data: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception(f"Error extracting auth data: {str(e)}")
             return None
     
+    def _query_first(self, selectors, enabled_only=False, preferred=None):
+        """Find the first visible element matching any of the selectors in one round trip
+        
+        Args:
+            selectors (list): CSS selectors, in order of preference
+            enabled_only (bool): Whether to skip disabled elements
+            preferred (str, optional): Selector to try before the others
+            
+        Returns:
+            tuple: (WebElement, matching selector), or (None, None) if nothing matched
+        """
+        if preferred:
+            selectors = [preferred] + [s for s in selectors if s != preferred]
+        match = self.driver.execute_script(QUERY_FIRST_JS, selectors, enabled_only)
+        return tuple(match) if match else (None, None)
+    
+    def _enter_text(self, input_element, text):
+        """Replace the contents of the input element with text
+        
+        The whole message is inserted in one CDP call instead of being typed
+        key by key; send_keys is the fallback when CDP is unavailable.
+        
+        Args:
+            input_element (WebElement): Input, textarea or contenteditable element
+            text (str): Text to enter
+        """
+        try:
+            # Inserted text replaces the selection, which clears the old contents
+            self.driver.execute_script(SELECT_CONTENTS_JS, input_element)
+            self.driver.execute_cdp_cmd("Input.insertText", {"text": text})
+        except Exception as e:
+            logger.warning(f"Falling back to send_keys: {str(e)}")
+            input_element.clear()
+            input_element.send_keys(text)
+    
+    def _submit_prompt(self, text):
+        """Type the message into the input element and submit it
+        
+        Args:
+            text (str): Message to send to Replit Agent
+            
+        Returns:
+            bool: False if the input element could not be found
+        """
+        # Find the input element (could be input or textarea)
+        logger.info("Locating input element...")
+        input_element, self._input_selector = self._query_first(
+            INPUT_SELECTORS, preferred=self._input_selector
+        )
+        
+        if not input_element:
+            return False
+        
+        # Replace any existing text with the new message
+        self._enter_text(input_element, text)
+        
+        logger.info("Finding submit button...")
+        # Find the submit button and click it
+        submit_button, self._submit_selector = self._query_first(
+            SUBMIT_SELECTORS, enabled_only=True, preferred=self._submit_selector
+        )
+        
+        if not submit_button:
+            # As a fallback, try to press Enter key on the input field
+            logger.info("Submit button not found, pressing Enter key...")
+            input_element.send_keys(Keys.RETURN)
+        else:
+            logger.info("Clicking submit button...")
+            submit_button.click()
+        return True
+    
+    def _wait_for_response(self):
+        """Wait for a response element to appear
+        
+        Returns:
+            bool: True if a response element was found
+        """
+        try:
+            WebDriverWait(self.driver, 60).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, RESPONSE_SELECTOR))
+            )
+            return True
+        except TimeoutException:
+            return False
+    
+    def _read_response(self):
+        """Read the text of the latest response element
+        
+        Returns:
+            str: Response text, or an empty string if none was found
+        """
+        response_elements = self.driver.find_elements(By.CSS_SELECTOR, RESPONSE_SELECTOR)
+        # Get the latest response (should be the last element)
+        for element in reversed(response_elements):
+            response_text = element.text
+            if response_text:
+                return response_text
+        return ""
+    
     async def send_message(self, text):
         """Send a message to Replit Agent and get the response
         
@@ -278,128 +634,46 @@ class ReplitBrowserClient:
         Returns:
             str: Response from Replit Agent
         """
+        # Created on first use so it belongs to the loop that sends messages
+        if self._send_lock is None:
+            self._send_lock = asyncio.Lock()
+        
+        # Prompts share one input box, so only one may be in flight at a time
+        async with self._send_lock:
+            return await self._send_message(text)
+    
+    async def _send_message(self, text):
+        """Submit a message and read the response; callers hold the send lock"""
         if not self.initialized:
             success = await self.start()
             if not success:
                 raise Exception("Failed to initialize browser")
         
         try:
-            # Find the input element (could be input or textarea)
-            logger.info("Locating input element...")
-            input_element = None
-            
-            try:
-                input_element = self.driver.find_element(By.CSS_SELECTOR, "textarea")
-            except NoSuchElementException:
-                try:
-                    input_element = self.driver.find_element(By.CSS_SELECTOR, "input[type='text']")
-                except NoSuchElementException:
-                    # Try XPath selectors if CSS selectors fail
-                    input_selectors = [
-                        "//textarea[contains(@placeholder, 'Ask')]",
-                        "//textarea[contains(@placeholder, 'Message')]",
-                        "//textarea[contains(@placeholder, 'Type')]",
-                        "//div[contains(@contenteditable, 'true')]",
-                        "//input[contains(@placeholder, 'Message')]"
-                    ]
-                    
-                    for selector in input_selectors:
-                        try:
-                            input_element = self.driver.find_element(By.XPATH, selector)
-                            if input_element:
-                                break
-                        except:
-                            continue
-            
-            if not input_element:
+            submitted = await self._call(self._submit_prompt, text)
+            if not submitted:
+                # The page may have gone stale; reload it once before giving up
+                logger.info("Input element not found, reloading page...")
+                await self._call(self._reload)
+                submitted = await self._call(self._submit_prompt, text)
+            if not submitted:
                 raise Exception("Could not find input element")
             
-            # Clear any existing text and enter the new message
-            input_element.clear()
-            input_element.send_keys(text)
-            
-            logger.info("Finding submit button...")
-            # Find the submit button and click it
-            submit_button = None
-            
-            # Try different selectors that might identify the submit button
-            selectors = [
-                "button[type='submit']", 
-                "button.send-button", 
-                "button:has(svg)",  # Button with an SVG icon
-                "div.input-area button",  # Button in an input area
-                "form button"  # Button within a form
-            ]
-            
-            for selector in selectors:
-                try:
-                    elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                    for element in elements:
-                        if element.is_displayed() and element.is_enabled():
-                            submit_button = element
-                            break
-                    if submit_button:
-                        break
-                except:
-                    continue
-            
-            if not submit_button:
-                # As a fallback, try to press Enter key on the input field
-                logger.info("Submit button not found, pressing Enter key...")
-                input_element.send_keys(Keys.RETURN)
-            else:
-                logger.info("Clicking submit button...")
-                submit_button.click()
-            
             # Wait for the response to appear
             logger.info("Waiting for response...")
-            
-            # Wait for the response to load (this selector might need adjustment)
-            response_selectors = [
-                ".agent-response", 
-                ".message.response", 
-                ".message:not(.user-message)",
-                ".response-container",
-                "[data-testid='ai-response']"
-            ]
-            
-            response_found = False
-            for selector in response_selectors:
-                try:
-                    WebDriverWait(self.driver, 60).until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, selector))
-                    )
-                    response_found = True
-                    break
-                except:
-                    continue
+            response_found = await self._call(self._wait_for_response)
             
             if not response_found:
                 logger.warning("Could not find response element using standard selectors")
             
-            # Allow some time for the full response to be rendered
-            await asyncio.sleep(2)
+            # Wait until the response has finished rendering
+            await self._wait_for_dom_quiescence()
             
             # Extract the response text
-            response_text = ""
-            for selector in response_selectors:
-                try:
-                    response_elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                    if response_elements:
-                        # Get the latest response (should be the last element)
-                        latest_response = response_elements[-1]
-                        response_text = latest_response.text
-                        if response_text:
-                            break
-                except:
-                    continue
+            response_text = await self._call(self._read_response)
             
             if response_text:
                 logger.info(f"Extracted response: {response_text[:100]}...")
-                
-                # Try to extract updated auth data in the background
-                asyncio.create_task(self.extract_auth_data())
-                
                 return response_text
             else:
                 return "No response received from Replit Agent."
@@ -408,10 +682,36 @@ class ReplitBrowserClient:
             logger.error("Timeout waiting for response from Replit Agent")
             return "Timeout waiting for response from Replit Agent."
         except Exception as e:
-            logger.error(f"Error sending message via browser automation: {e}")
-            logger.error(traceback.format_exc())
+            logger.exception(f"Error sending message via browser automation: {e}")
             return f"Error: {str(e)}"
     
+    async def _wait_for_dom_quiescence(self, idle_ms=QUIESCENCE_MS, timeout=QUIESCENCE_TIMEOUT):
+        """Wait until no DOM mutations have been observed for idle_ms
+        
+        Args:
+            idle_ms (int): How long the DOM must stay unchanged, in milliseconds
+            timeout (float): Maximum time to wait, in seconds
+            
+        Returns:
+            bool: True if the DOM settled before the timeout
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            idle = await self._call(self.driver.execute_script, "return Date.now() - (window.__lastMut || 0);")
+            if idle >= idle_ms:
+                return True
+            await asyncio.sleep(max(idle_ms - idle, 50) / 1000)
+        
+        logger.warning(f"DOM did not settle within {timeout} seconds")
+        return False
+    
+    async def __aenter__(self):
+        await self.start()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+    
     def get_auth_data(self):
         """Get the cached authentication data"""
         return self.auth_data
@@ -425,5 +725,147 @@ class ReplitBrowserClient:
             except Exception as e:
                 logger.error(f"Error closing browser session: {e}")
             finally:
+                atexit.unregister(self.close)
                 self.driver = None
-                self.initialized = False
\ No newline at end of file
+                self.initialized = False
+                self._input_selector = self._submit_selector = None
+
+
+class BrowserClientPool:
+    """Thread-safe pool of started browser clients
+
+    Launching Chrome and loading the AI page takes several seconds, so
+    clients are started ahead of time and handed back to the pool instead of
+    being closed. The bot runs each message on its own event loop, so the
+    pool only uses thread-safe primitives and warms clients on a thread.
+    """
+    
+    def __init__(self, size=None, cookies_file=None, headless=True):
+        """Initialize the pool
+        
+        Args:
+            size (int, optional): Maximum live clients. Defaults to $BROWSER_CLIENT_POOL_SIZE or 2.
+            cookies_file (str, optional): Cookies file used by pooled clients
+            headless (bool): Whether pooled clients run headless
+        """
+        self.size = size or int(os.environ.get('BROWSER_CLIENT_POOL_SIZE', '2'))
+        self.cookies_file = cookies_file or os.environ.get('COOKIES_FILE', './storage/cookies.json')
+        self.headless = headless
+        self._idle = queue.Queue()
+        # Each slot owns a Chrome profile directory; a free slot may start a client
+        self._free_slots = queue.Queue()
+        for slot in range(self.size):
+            self._free_slots.put(slot)
+        self._warming = threading.Lock()
+        atexit.register(self.shutdown)
+    
+    async def _start_client(self, slot):
+        """Start a client in the given slot
+        
+        Args:
+            slot (int): Slot number, used to give the client its own profile
+            
+        Returns:
+            ReplitBrowserClient: The started client, or None if it failed to start
+        """
+        # Chrome locks its profile, so each slot after the first gets a sibling directory
+        profile_dir = os.environ.get('BROWSER_PROFILE_DIR', './storage/browser_profile')
+        if slot:
+            profile_dir = f"{profile_dir}-{slot}"
+        
+        client = ReplitBrowserClient(cookies_file=self.cookies_file, headless=self.headless, profile_dir=profile_dir)
+        client.pool_slot = slot
+        if await client.start():
+            return client
+        
+        self._free_slots.put(slot)
+        return None
+    
+    async def acquire(self):
+        """Get a started client, starting one if a slot is free
+        
+        Returns:
+            ReplitBrowserClient: A started client, or None if none could be started
+        """
+        client = None
+        while client is None:
+            try:
+                client = self._idle.get_nowait()
+            except queue.Empty:
+                try:
+                    slot = self._free_slots.get_nowait()
+                except queue.Empty:
+                    # Every slot is in use; wait for a client to be released
+                    try:
+                        client = await asyncio.to_thread(self._idle.get, True, POOL_ACQUIRE_TIMEOUT)
+                    except queue.Empty:
+                        logger.error("Timed out waiting for a pooled browser client")
+                        return None
+                else:
+                    client = await self._start_client(slot)
+                    if client is None:
+                        return None
+            
+            # Drop clients whose browser has died while idle
+            if not client.initialized:
+                self.discard(client)
+                client = None
+        
+        self.warm_in_background()
+        return client
+    
+    def release(self, client):
+        """Return a client to the pool
+        
+        Args:
+            client (ReplitBrowserClient): Client obtained from acquire
+        """
+        if client.initialized and client.driver:
+            self._idle.put(client)
+        else:
+            self.discard(client)
+    
+    def discard(self, client):
+        """Close a client and free its slot"""
+        try:
+            client.close()
+        finally:
+            self._free_slots.put(client.pool_slot)
+    
+    async def _fill(self):
+        """Start clients until every slot is in use"""
+        while True:
+            try:
+                slot = self._free_slots.get_nowait()
+            except queue.Empty:
+                return
+            client = await self._start_client(slot)
+            if client is None:
+                return
+            self._idle.put(client)
+    
+    def _warm(self):
+        try:
+            asyncio.run(self._fill())
+        except Exception as e:
+            logger.error(f"Error warming browser clients: {e}")
+        finally:
+            self._warming.release()
+    
+    def warm_in_background(self):
+        """Start clients for the free slots on a background thread"""
+        if self._free_slots.empty() or not self._warming.acquire(blocking=False):
+            return
+        threading.Thread(target=self._warm, name="browser-pool-warmer", daemon=True).start()
+    
+    def shutdown(self):
+        """Close every idle client"""
+        while True:
+            try:
+                client = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self.discard(client)
+
+
+browser_client_pool = BrowserClientPool()
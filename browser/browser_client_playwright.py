@@ -1,13 +1,421 @@
 import os
 import json
 import time
+import atexit
+import shutil
+import hashlib
 import asyncio
 import logging
-import traceback
+import tempfile
+import threading
+import subprocess
+import weakref
+import collections
 from playwright.async_api import async_playwright
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 logger = logging.getLogger(__name__)
 
+# Fixed remote debugging port for the shared Chromium; 0 lets Chromium pick one
+CDP_PORT = int(os.environ.get('CHROMIUM_CDP_PORT', '0'))
+
+# Pages kept navigated and ready for new clients, per event loop and cookies file
+WARM_PAGES = int(os.environ.get('BROWSER_WARM_PAGES', '2'))
+# Seconds a warm page may sit unused before it is closed instead of handed out
+WARM_PAGE_TTL = 300
+
+# The response is considered fully rendered once it has been unchanged this long
+QUIESCENCE_MS = 500
+# Upper bound on how long to wait for the response to settle after it appears
+QUIESCENCE_TIMEOUT = 30
+
+# Cookie export sameSite spellings mapped to the values Playwright accepts
+SAME_SITE_VALUES = {'strict': 'Strict', 'lax': 'Lax', 'none': 'None', 'no_restriction': 'None'}
+
+# Media, fonts and trackers the automation never uses; blocked through CDP,
+# which unlike route interception keeps the HTTP cache working
+BLOCKED_URL_PATTERNS = (
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.mp4", "*.webm",
+    "*google-analytics*", "*googletagmanager*", "*doubleclick*", "*segment.io*",
+)
+
+# Selectors for the prompt input, in order of preference
+INPUT_SELECTORS = [
+    "textarea",
+    "input[type='text']",
+    "div[contenteditable='true']",
+    "[placeholder*='Ask']",
+    "[placeholder*='Message']",
+    "[placeholder*='Type']"
+]
+
+# Selectors that might identify the submit button
+SUBMIT_SELECTORS = [
+    "button[type='submit']",
+    "button.send-button",
+    "button:has(svg)",
+    "div.input-area button",
+    "form button"
+]
+
+# Selectors that might hold the agent's response
+RESPONSE_SELECTORS = [
+    ".agent-response",
+    ".message.response",
+    ".message:not(.user-message)",
+    ".response-container",
+    "[data-testid='ai-response']"
+]
+RESPONSE_SELECTOR = ", ".join(RESPONSE_SELECTORS)
+
+# Returns the first element matching the selectors, tried in order, in one round-trip
+QUERY_FIRST_JS = """([selectors, visibleOnly]) => {
+    for (const s of selectors) {
+        for (const e of document.querySelectorAll(s)) {
+            if (!visibleOnly || e.offsetParent !== null) return e;
+        }
+    }
+    return null;
+}"""
+
+# Resolves once the latest response and its siblings stop changing for quietMs,
+# or after timeoutMs; resolves true if the content settled
+SETTLE_JS = """([selector, quietMs, timeoutMs]) => new Promise(resolve => {
+    const matches = document.querySelectorAll(selector);
+    const latest = matches[matches.length - 1];
+    const target = (latest && latest.parentElement) || document.body;
+    let quiet = setTimeout(() => done(true), quietMs);
+    const deadline = setTimeout(() => done(false), timeoutMs);
+    const observer = new MutationObserver(() => {
+        clearTimeout(quiet);
+        quiet = setTimeout(() => done(true), quietMs);
+    });
+    function done(settled) {
+        observer.disconnect();
+        clearTimeout(quiet);
+        clearTimeout(deadline);
+        resolve(settled);
+    }
+    observer.observe(target, {subtree: true, childList: true, characterData: true});
+})"""
+
+# True if the page shows a login link or prompt; only a boolean crosses CDP
+LOGGED_OUT_JS = """() => {
+    if (document.querySelector("a[href*='/login'], button[data-cy='login'], button[data-testid='login'], form[action*='login']")) return true;
+    return /(?:Log|Sign)\\s*in/.test(document.body ? document.body.innerText : '');
+}"""
+
+# Returns every localStorage item as an object
+LOCAL_STORAGE_JS = """() => {
+    let items = {};
+    for (let i = 0; i < localStorage.length; i++) {
+        const key = localStorage.key(i);
+        items[key] = localStorage.getItem(key);
+    }
+    return items;
+}"""
+
+# Returns the visible text that follows the latest occurrence of the prompt, used
+# when no response element matches; the page text itself never crosses CDP
+VISIBLE_TEXT_JS = """(prompt) => {
+    // Visibility is memoized per element, so each ancestor's style is read once
+    const visibility = new WeakMap();
+    const isVisible = (element) => {
+        if (!element) return true;
+        if (visibility.has(element)) return visibility.get(element);
+        const style = window.getComputedStyle(element);
+        const visible = style.display !== 'none' && style.visibility !== 'hidden' &&
+            style.opacity !== '0' && isVisible(element.parentElement);
+        visibility.set(element, visible);
+        return visible;
+    };
+    
+    const walker = document.createTreeWalker(
+        document.body,
+        NodeFilter.SHOW_TEXT,
+        null,
+        false
+    );
+    
+    let text = [];
+    let node;
+    
+    while(node = walker.nextNode()) {
+        const content = node.textContent.trim();
+        if(content && isVisible(node.parentElement)) {
+            text.push(content);
+        }
+    }
+    
+    const allText = text.join(' ');
+    const index = allText.toLowerCase().lastIndexOf(prompt.toLowerCase());
+    return index >= 0 ? allText.slice(index + prompt.length).trim() : '';
+}"""
+
+class SharedChromium:
+    """One Chromium process per headless mode, shared by every client over CDP
+
+    Clients connect over CDP and each works in its own BrowserContext, so
+    users stay isolated while the browser, network and storage processes
+    are paid for once. This also works across event loops, since only the
+    process is shared, not the Playwright objects.
+    """
+    
+    def __init__(self):
+        """Initialize the shared browser registry"""
+        self._endpoints = {}  # headless flag -> CDP endpoint URL
+        self._processes = {}  # headless flag -> (Popen, user data dir) of the live browser
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+    
+    def endpoint(self, executable_path, headless=True, timeout=15):
+        """Get the CDP endpoint of the shared browser, launching it on first use
+        
+        Args:
+            executable_path (str): Chromium binary to launch
+            headless (bool): Whether the browser runs headless
+            timeout (int): Seconds to wait for the browser to start
+            
+        Returns:
+            str: HTTP endpoint to pass to connect_over_cdp
+        """
+        external = os.environ.get('CHROMIUM_CDP_ENDPOINT')
+        if external:
+            return external
+        
+        with self._lock:
+            endpoint = self._endpoints.get(headless)
+            if endpoint:
+                process, _ = self._processes[headless]
+                if process.poll() is None:
+                    return endpoint
+                logger.warning("Shared Chromium exited, relaunching")
+                self._discard(headless)
+            
+            user_data_dir = tempfile.mkdtemp(prefix="replit-chromium-")
+            args = [
+                executable_path,
+                f"--remote-debugging-port={CDP_PORT}",
+                f"--user-data-dir={user_data_dir}",
+                "--no-sandbox",
+                "--disable-dev-shm-usage",
+                "--disable-gpu",
+                "--no-first-run",
+                "--no-default-browser-check",
+            ]
+            if headless:
+                args.append("--headless=new")
+            args.append("about:blank")
+            
+            logger.info("Launching shared Chromium")
+            process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self._processes[headless] = (process, user_data_dir)
+            
+            # Chromium writes the port it picked to DevToolsActivePort
+            port_file = os.path.join(user_data_dir, "DevToolsActivePort")
+            deadline = time.time() + timeout
+            while time.time() < deadline:
+                if process.poll() is not None:
+                    self._discard(headless)
+                    raise Exception("Shared Chromium exited during startup")
+                try:
+                    with open(port_file, 'r') as f:
+                        port = f.readline().strip()
+                    if port:
+                        break
+                except OSError:
+                    pass
+                time.sleep(0.05)
+            else:
+                self._discard(headless)
+                raise Exception("Timed out waiting for shared Chromium to start")
+            
+            endpoint = f"http://127.0.0.1:{port}"
+            self._endpoints[headless] = endpoint
+            logger.info(f"Shared Chromium listening on {endpoint}")
+            return endpoint
+    
+    def _discard(self, headless):
+        """Stop the browser for a headless mode and remove its profile
+        
+        Must be called with the lock held.
+        
+        Args:
+            headless (bool): Headless mode whose browser to drop
+        """
+        self._endpoints.pop(headless, None)
+        entry = self._processes.pop(headless, None)
+        if entry is not None:
+            self._terminate(*entry)
+    
+    @staticmethod
+    def _terminate(process, user_data_dir):
+        """Terminate a browser process and delete its temporary profile"""
+        try:
+            process.terminate()
+            process.wait(timeout=5)
+        except Exception:
+            process.kill()
+        shutil.rmtree(user_data_dir, ignore_errors=True)
+    
+    def shutdown(self):
+        """Terminate every browser started by the registry"""
+        with self._lock:
+            processes = list(self._processes.values())
+            self._processes.clear()
+            self._endpoints.clear()
+        for process, user_data_dir in processes:
+            self._terminate(process, user_data_dir)
+
+shared_chromium = SharedChromium()
+
+class SharedPlaywright:
+    """One Playwright driver and CDP connection per event loop, shared by its clients
+
+    Every async_playwright().start() spawns a driver process, and Playwright
+    objects are bound to the loop that created them, so clients on the same
+    loop share one driver and one connection to the shared Chromium and
+    only own a BrowserContext. The connection is dropped with its last client.
+    """
+    
+    def __init__(self):
+        """Initialize the connection registry"""
+        self._connections = {}  # (event loop, headless flag) -> [playwright, browser, refcount]
+        self._locks = weakref.WeakKeyDictionary()  # event loop -> asyncio.Lock
+    
+    def _lock(self):
+        loop = asyncio.get_running_loop()
+        lock = self._locks.get(loop)
+        if lock is None:
+            lock = self._locks[loop] = asyncio.Lock()
+        return lock
+    
+    async def acquire(self, headless=True):
+        """Get the shared browser connection for the running loop
+        
+        Args:
+            headless (bool): Whether the browser runs headless
+            
+        Returns:
+            Browser: Connected browser; pair every call with release()
+        """
+        key = (asyncio.get_running_loop(), headless)
+        async with self._lock():
+            entry = self._connections.get(key)
+            if entry is None or not entry[1].is_connected():
+                playwright = entry[0] if entry else await async_playwright().start()
+                endpoint = await asyncio.to_thread(
+                    shared_chromium.endpoint, playwright.chromium.executable_path, headless
+                )
+                browser = await playwright.chromium.connect_over_cdp(endpoint)
+                entry = [playwright, browser, entry[2] if entry else 0]
+                self._connections[key] = entry
+            entry[2] += 1
+            return entry[1]
+    
+    async def release(self, headless=True):
+        """Give back a connection obtained from acquire on the running loop
+        
+        Args:
+            headless (bool): Whether the browser runs headless
+        """
+        key = (asyncio.get_running_loop(), headless)
+        async with self._lock():
+            entry = self._connections.get(key)
+            if entry is None:
+                return
+            entry[2] -= 1
+            if entry[2] > 0:
+                return
+            del self._connections[key]
+        
+        playwright, browser, _ = entry
+        # For a CDP connection this disconnects rather than killing the browser
+        await browser.close()
+        await playwright.stop()
+
+shared_playwright = SharedPlaywright()
+
+class WarmPagePool:
+    """Pages already navigated to the AI page, handed to clients as they start
+
+    Navigating and waiting for the input dominates client startup, so a
+    background task keeps a few pages ready per event loop and cookies file.
+    Each warm page holds a reference on the shared browser connection, which
+    passes to the client that takes it.
+    """
+    
+    def __init__(self, min_warm=WARM_PAGES, idle_ttl=WARM_PAGE_TTL):
+        """Initialize the pool
+        
+        Args:
+            min_warm (int): Pages to keep ready for each kind of client
+            idle_ttl (int): Seconds before an unused page is closed
+        """
+        self.min_warm = min_warm
+        self.idle_ttl = idle_ttl
+        self._pages = {}  # (event loop, cookies file, headless) -> deque of (browser, context, page, ws_data, warmed at)
+        self._tasks = {}  # same key -> refill task in progress
+    
+    async def take(self, cookies_file, headless=True):
+        """Get a warm page and start refilling the pool
+        
+        Args:
+            cookies_file (str): Cookies file the page's context was seeded with
+            headless (bool): Whether the browser runs headless
+            
+        Returns:
+            tuple: (browser, context, page, ws_data), or None if no page is ready
+        """
+        key = (asyncio.get_running_loop(), cookies_file, headless)
+        await self._evict_stale(key)
+        pages = self._pages.get(key)
+        warm = pages.popleft()[:4] if pages else None
+        self.refill(cookies_file, headless)
+        return warm
+    
+    def refill(self, cookies_file, headless=True):
+        """Top the pool up to min_warm pages in the background"""
+        loop = asyncio.get_running_loop()
+        key = (loop, cookies_file, headless)
+        task = self._tasks.get(key)
+        if self.min_warm <= 0 or (task is not None and not task.done()):
+            return
+        self._tasks[key] = loop.create_task(self._fill(key, cookies_file, headless))
+    
+    async def _fill(self, key, cookies_file, headless):
+        pages = self._pages.setdefault(key, collections.deque())
+        while len(pages) < self.min_warm:
+            client = ReplitBrowserClient(cookies_file=cookies_file, headless=headless)
+            try:
+                opened = await client._open_page()
+            except Exception as e:
+                logger.warning(f"Could not warm a browser page: {str(e)}")
+                opened = False
+            if not opened:
+                await client.close()
+                return
+            pages.append((client.browser, client.context, client.page, client.ws_data, time.monotonic()))
+    
+    async def _evict_stale(self, key):
+        pages = self._pages.get(key)
+        now = time.monotonic()
+        while pages and (now - pages[0][4] >= self.idle_ttl or pages[0][2].is_closed()):
+            _, context, _, _, _ = pages.popleft()
+            try:
+                await context.close()
+            except Exception as e:
+                logger.warning(f"Error closing warm page: {str(e)}")
+            await shared_playwright.release(key[2])
+
+warm_page_pool = WarmPagePool()
+
 class ReplitBrowserClient:
     """Client for interacting with Replit agent through browser automation using Playwright"""
     
@@ -20,7 +428,6 @@ class ReplitBrowserClient:
         """
         self.cookies_file = cookies_file
         self.headless = headless
-        self.playwright = None
         self.browser = None
         self.context = None
         self.page = None
@@ -28,6 +435,8 @@ class ReplitBrowserClient:
         self.REPLIT_URL = "https://replit.com/ai"
         self.last_extraction_time = 0
         self.auth_data = None
+        self._cookie_key = None  # digest of the cookies auth_data was built from
+        self.ws_data = {'connections': [], 'connection_params': None}
     
     async def start(self):
         """Start the browser session"""
@@ -38,51 +447,13 @@ class ReplitBrowserClient:
         logger.info("Initializing browser client with Playwright...")
         
         try:
-            # Launch playwright
-            self.playwright = await async_playwright().start()
-            
-            # Launch chromium browser
-            self.browser = await self.playwright.chromium.launch(
-                headless=self.headless,
-                args=[
-                    "--no-sandbox",
-                    "--disable-dev-shm-usage",
-                    "--disable-gpu",
-                ]
-            )
-            
-            # Create a browser context
-            self.context = await self.browser.new_context(
-                viewport={"width": 1920, "height": 1080},
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-            )
-            
-            # Create a new page
-            self.page = await self.context.new_page()
-            
-            # Load cookies if available
-            if self.cookies_file and os.path.exists(self.cookies_file):
-                await self._load_cookies()
-            
-            # Navigate to Replit Agent
-            logger.info(f"Navigating to {self.REPLIT_URL}...")
-            await self.page.goto(self.REPLIT_URL, wait_until="networkidle")
-            
-            # Wait for the page to load
-            try:
-                # Check if we're logged in
-                input_selector = "textarea, input[type='text']"
-                await self.page.wait_for_selector(input_selector, timeout=20000)
-            except Exception as e:
-                # If we can't find the input, check if we need to log in
-                page_content = await self.page.content()
-                if "Log in" in page_content or "Sign in" in page_content:
-                    logger.error("Authentication required - not logged in")
-                    self.initialized = False
-                    return False
-            
-            # Setup monitoring for network requests
-            await self._setup_network_monitoring()
+            warm = await warm_page_pool.take(self.cookies_file, self.headless)
+            if warm:
+                logger.info("Using a pre-navigated page")
+                self.browser, self.context, self.page, self.ws_data = warm
+            elif not await self._open_page():
+                await self.close()
+                return False
             
             logger.info("Browser client initialized successfully")
             self.initialized = True
@@ -93,121 +464,133 @@ class ReplitBrowserClient:
             return True
         
         except Exception as e:
-            logger.error(f"Failed to initialize browser client: {e}")
-            logger.error(traceback.format_exc())
+            logger.exception(f"Failed to initialize browser client: {e}")
             await self.close()
             self.initialized = False
             return False
     
-    async def _load_cookies(self):
-        """Load cookies from file into the browser session"""
+    async def _open_page(self):
+        """Open this client's context and page and navigate to Replit Agent
+        
+        Returns:
+            bool: False if the page shows that authentication is required
+        """
+        # Attach to the shared chromium browser
+        self.browser = await shared_playwright.acquire(self.headless)
+        
+        # Load cookies if available
+        storage_state = None
+        if self.cookies_file and os.path.exists(self.cookies_file):
+            storage_state = self._load_storage_state()
+        
+        # Create an isolated context for this client, seeded with its cookies
+        self.context = await self.browser.new_context(
+            viewport={"width": 1920, "height": 1080},
+            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            storage_state=storage_state
+        )
+        
+        # Create a new page
+        self.page = await self.context.new_page()
+        
+        # Setup monitoring for network requests before anything loads
+        self._setup_network_monitoring()
+        await self._block_heavy_resources()
+        
+        # Navigate to Replit Agent
+        logger.info(f"Navigating to {self.REPLIT_URL}...")
+        # The input wait below is the real readiness signal, so don't wait for network idle
+        await self.page.goto(self.REPLIT_URL, wait_until="domcontentloaded")
+        
+        # Wait for the page to load
+        try:
+            # Check if we're logged in
+            input_selector = "textarea, input[type='text']"
+            await self.page.wait_for_selector(input_selector, timeout=20000)
+        except Exception as e:
+            # If we can't find the input, check if we need to log in
+            if await self.page.evaluate(LOGGED_OUT_JS):
+                logger.error("Authentication required - not logged in")
+                return False
+        
+        return True
+    
+    def _load_storage_state(self):
+        """Build a Playwright storage state from the cookies file
+        
+        Returns:
+            dict: Storage state for new_context, or None if the cookies could not be read
+        """
         try:
             logger.info(f"Loading cookies from {self.cookies_file}")
             
-            # First visit the domain to set cookies
-            await self.page.goto("https://replit.com", wait_until="domcontentloaded")
-            
             # Load cookies from file
-            with open(self.cookies_file, 'r') as f:
-                cookies = json.load(f)
+            with open(self.cookies_file, 'rb') as f:
+                cookies = _json_loads(f.read())
             
             # Convert cookies to Playwright format
-            playwright_cookies = []
-            for cookie in cookies:
-                if 'domain' in cookie and ('replit.com' in cookie['domain']):
-                    playwright_cookie = {
-                        'name': cookie.get('name'),
-                        'value': cookie.get('value'),
-                        'domain': cookie.get('domain'),
-                        'path': cookie.get('path', '/'),
-                        'secure': cookie.get('secure', False),
-                        'httpOnly': cookie.get('httpOnly', False)
-                    }
-                    # Add expiry if present
-                    if 'expiry' in cookie:
-                        playwright_cookie['expires'] = cookie['expiry']
-                    playwright_cookies.append(playwright_cookie)
-            
-            # Add cookies to context
-            await self.context.add_cookies(playwright_cookies)
-            
-            # Verify cookies were set
-            logger.info(f"Added {len(playwright_cookies)} cookies")
+            playwright_cookies = [
+                {
+                    'name': cookie.get('name'),
+                    'value': cookie.get('value'),
+                    'domain': cookie['domain'],
+                    'path': cookie.get('path', '/'),
+                    'secure': cookie.get('secure', False),
+                    'httpOnly': cookie.get('httpOnly', False),
+                    # Storage state needs an expiry; -1 marks a session cookie
+                    'expires': cookie.get('expiry', -1),
+                    'sameSite': SAME_SITE_VALUES.get(str(cookie.get('sameSite', '')).lower(), 'Lax')
+                }
+                for cookie in cookies
+                if 'replit.com' in cookie.get('domain', '')
+            ]
             
-            return True
+            logger.info(f"Prepared {len(playwright_cookies)} cookies")
+            return {'cookies': playwright_cookies, 'origins': []}
         except Exception as e:
-            logger.error(f"Error loading cookies: {str(e)}")
-            logger.error(traceback.format_exc())
-            return False
+            logger.exception(f"Error loading cookies: {str(e)}")
+            return None
     
-    async def _setup_network_monitoring(self):
-        """Set up monitoring of network requests in the browser"""
+    async def _block_heavy_resources(self):
+        """Stop the page from fetching media, fonts and trackers"""
         try:
-            # Add JavaScript to monitor WebSockets
-            await self.page.evaluate("""() => {
-                // Store WebSocket traffic information
-                window.__ws_traffic = {
-                    connections: [],
-                    messages: []
-                };
-                
-                // Override WebSocket to monitor traffic
-                const originalWebSocket = window.WebSocket;
-                window.WebSocket = function(url, protocols) {
-                    console.log('WebSocket connection to:', url);
-                    
-                    // Create actual WebSocket
-                    const ws = new originalWebSocket(url, protocols);
-                    
-                    // Log connection
-                    window.__ws_traffic.connections.push({
-                        url: url,
-                        protocols: protocols,
-                        time: new Date().toISOString()
-                    });
-                    
-                    // Monitor send method
-                    const originalSend = ws.send;
-                    ws.send = function(data) {
-                        try {
-                            window.__ws_traffic.messages.push({
-                                direction: 'outgoing',
-                                data: typeof data === 'string' ? data : '[binary data]',
-                                time: new Date().toISOString()
-                            });
-                            console.log('WS SEND:', typeof data === 'string' ? data : '[binary data]');
-                        } catch (e) {
-                            console.error('Error logging WebSocket send:', e);
-                        }
-                        
-                        return originalSend.apply(this, arguments);
-                    };
-                    
-                    // Monitor incoming messages
-                    ws.addEventListener('message', function(event) {
-                        try {
-                            window.__ws_traffic.messages.push({
-                                direction: 'incoming',
-                                data: typeof event.data === 'string' ? event.data : '[binary data]',
-                                time: new Date().toISOString()
-                            });
-                            console.log('WS RECEIVE:', typeof event.data === 'string' ? event.data : '[binary data]');
-                        } catch (e) {
-                            console.error('Error logging WebSocket message:', e);
-                        }
-                    });
-                    
-                    return ws;
-                };
-                
-                console.log('WebSocket monitoring set up');
-            }""")
-            logger.info("Network monitoring set up successfully")
-            return True
+            cdp = await self.context.new_cdp_session(self.page)
+            await cdp.send("Network.enable")
+            await cdp.send("Network.setBlockedURLs", {"urls": list(BLOCKED_URL_PATTERNS)})
         except Exception as e:
-            logger.error(f"Error setting up network monitoring: {str(e)}")
-            logger.error(traceback.format_exc())
-            return False
+            logger.warning(f"Could not block heavy resources: {str(e)}")
+    
+    def _setup_network_monitoring(self):
+        """Watch the page's WebSockets for the connection parameters
+        
+        Playwright pushes each sent frame to the handler, so frames are
+        filtered as they happen instead of being buffered in the page and
+        polled. The handlers only touch ws_data, which moves with the page
+        when a warm page is handed to another client.
+        """
+        ws_data = self.ws_data
+        
+        def on_frame_sent(payload):
+            # Cheap substring check first; most frames are not the handshake
+            if not isinstance(payload, str) or 'clientId' not in payload:
+                return
+            try:
+                data = _json_loads(payload)
+            except ValueError:
+                return
+            if isinstance(data, dict) and 'clientId' in data and 'sessionId' in data:
+                ws_data['connection_params'] = {
+                    'clientId': data['clientId'],
+                    'sessionId': data['sessionId'],
+                    'tokenCluster': data.get('tokenCluster', 'picard')
+                }
+        
+        def on_websocket(ws):
+            ws_data['connections'].append({'url': ws.url, 'time': int(time.time())})
+            ws.on("framesent", on_frame_sent)
+        
+        self.page.on("websocket", on_websocket)
+        logger.info("Network monitoring set up successfully")
     
     async def extract_auth_data(self):
         """Extract authentication data from the browser session"""
@@ -219,64 +602,73 @@ class ReplitBrowserClient:
         current_time = time.time()
         if self.auth_data and current_time - self.last_extraction_time < 300:
             logger.info("Using cached auth data (extracted less than 5 minutes ago)")
+            # Connection parameters can arrive after the cached extraction
+            if self.ws_data['connection_params']:
+                self.auth_data['connection_params'] = self.ws_data['connection_params']
             return self.auth_data
         
         try:
             logger.info("Extracting authentication data from browser")
             
+            cookies = await self.context.cookies()
+            
+            # Auth lives in the cookies; while they are unchanged the rest of the
+            # extraction would produce the same data, so keep the cached copy
+            cookie_key = hashlib.blake2b(
+                "|".join(sorted(f"{cookie['name']}={cookie['value']}" for cookie in cookies)).encode(),
+                digest_size=8
+            ).digest()
+            if self.auth_data and cookie_key == self._cookie_key:
+                logger.info("Cookies unchanged, keeping cached auth data")
+                self.last_extraction_time = current_time
+                if self.ws_data['connection_params']:
+                    self.auth_data['connection_params'] = self.ws_data['connection_params']
+                return self.auth_data
+            
             auth_data = {
-                'cookies': {},
+                'cookies': {cookie['name']: cookie['value'] for cookie in cookies},
                 'local_storage': {},
                 'websocket_data': {},
                 'timestamp': int(time.time())
             }
             
-            # Extract cookies
-            cookies = await self.context.cookies()
-            auth_data['cookies'] = {cookie['name']: cookie['value'] for cookie in cookies}
-            
-            # Extract localStorage data
-            local_storage = await self.page.evaluate("""() => {
-                let items = {};
-                for (let i = 0; i < localStorage.length; i++) {
-                    const key = localStorage.key(i);
-                    items[key] = localStorage.getItem(key);
-                }
-                return items;
-            }""")
-            auth_data['local_storage'] = local_storage
-            
-            # Extract WebSocket traffic data
-            ws_traffic = await self.page.evaluate("() => window.__ws_traffic")
-            if ws_traffic:
-                auth_data['websocket_data'] = ws_traffic
-                
-                # Extract WebSocket connection parameters
-                for msg in ws_traffic.get('messages', []):
-                    if msg.get('direction') == 'outgoing' and isinstance(msg.get('data'), str):
-                        try:
-                            data = json.loads(msg['data'])
-                            if 'clientId' in data and 'sessionId' in data:
-                                auth_data['connection_params'] = {
-                                    'clientId': data['clientId'],
-                                    'sessionId': data['sessionId'],
-                                    'tokenCluster': data.get('tokenCluster', 'picard')
-                                }
-                                break
-                        except:
-                            pass
+            try:
+                auth_data['local_storage'] = await self.page.evaluate(LOCAL_STORAGE_JS)
+            except Exception as e:
+                logger.warning(f"Could not extract localStorage: {str(e)}")
+            
+            # WebSocket data is collected as frames are sent
+            auth_data['websocket_data'] = {'connections': list(self.ws_data['connections'])}
+            if self.ws_data['connection_params']:
+                auth_data['connection_params'] = self.ws_data['connection_params']
             
             self.auth_data = auth_data
+            self._cookie_key = cookie_key
             self.last_extraction_time = current_time
             logger.info(f"Extracted {len(auth_data['cookies'])} cookies and {len(auth_data['local_storage'])} localStorage items")
             
             return auth_data
         
         except Exception as e:
-            logger.error(f"Error extracting auth data: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception(f"Error extracting auth data: {str(e)}")
             return None
     
+    async def _query_first(self, selectors, visible_only=False):
+        """Find the first element matching any of the selectors in a single evaluate
+        
+        Args:
+            selectors (list): CSS selectors, in order of preference
+            visible_only (bool): Whether to skip elements that are not rendered
+            
+        Returns:
+            ElementHandle: The matching element, or None if nothing matched
+        """
+        handle = await self.page.evaluate_handle(QUERY_FIRST_JS, [selectors, visible_only])
+        element = handle.as_element()
+        if element is None:
+            await handle.dispose()
+        return element
+    
     async def send_message(self, text):
         """Send a message to Replit Agent and get the response
         
@@ -295,58 +687,19 @@ class ReplitBrowserClient:
             # Find the input element (could be input or textarea)
             logger.info("Locating input element...")
             
-            # Try various input selectors
-            input_selectors = [
-                "textarea", 
-                "input[type='text']",
-                "div[contenteditable='true']",
-                "[placeholder*='Ask']",
-                "[placeholder*='Message']",
-                "[placeholder*='Type']"
-            ]
-            
-            input_element = None
-            for selector in input_selectors:
-                try:
-                    input_element = await self.page.query_selector(selector)
-                    if input_element:
-                        break
-                except:
-                    continue
+            input_element = await self._query_first(INPUT_SELECTORS)
             
             if not input_element:
                 raise Exception("Could not find input element")
             
-            # Clear any existing text and enter the new message
-            await input_element.click()
-            await input_element.fill("")
-            await input_element.type(text)
+            # Replace any existing text with the new message in one call; fill
+            # focuses the input and fires the input event the page listens for
+            await input_element.fill(text)
             
             logger.info("Finding submit button...")
             # Find the submit button and click it
             
-            # Try different selectors that might identify the submit button
-            submit_selectors = [
-                "button[type='submit']", 
-                "button.send-button", 
-                "button:has(svg)",  
-                "div.input-area button",  
-                "form button"  
-            ]
-            
-            submit_button = None
-            for selector in submit_selectors:
-                try:
-                    elements = await self.page.query_selector_all(selector)
-                    for element in elements:
-                        is_visible = await element.is_visible()
-                        if is_visible:
-                            submit_button = element
-                            break
-                    if submit_button:
-                        break
-                except:
-                    continue
+            submit_button = await self._query_first(SUBMIT_SELECTORS, visible_only=True)
             
             if not submit_button:
                 # As a fallback, try to press Enter key on the input field
@@ -359,93 +712,26 @@ class ReplitBrowserClient:
             # Wait for the response to appear
             logger.info("Waiting for response...")
             
-            # Wait for the response to load (this selector might need adjustment)
-            response_selectors = [
-                ".agent-response", 
-                ".message.response", 
-                ".message:not(.user-message)",
-                ".response-container",
-                "[data-testid='ai-response']"
-            ]
-            
-            response_found = False
-            for selector in response_selectors:
-                try:
-                    await self.page.wait_for_selector(selector, timeout=60000)
-                    response_found = True
-                    break
-                except:
-                    continue
-            
-            if not response_found:
+            # One wait covers every selector instead of up to a minute per selector
+            responses = self.page.locator(RESPONSE_SELECTOR)
+            try:
+                await responses.first.wait_for(timeout=60000)
+            except Exception:
                 logger.warning("Could not find response element using standard selectors")
             
-            # Allow some time for the full response to be rendered
-            await asyncio.sleep(2)
+            # Wait for the full response to be rendered
+            await self._wait_for_response_settled()
             
-            # Extract the response text
-            response_text = ""
-            for selector in response_selectors:
-                try:
-                    elements = await self.page.query_selector_all(selector)
-                    for element in elements:
-                        text = await element.text_content()
-                        if text and len(text.strip()) > 0:
-                            response_text = text.strip()
-                            break
-                    if response_text:
-                        break
-                except:
-                    continue
+            # Extract the response text from the latest (last) non-empty element
+            texts = [text.strip() for text in await responses.all_text_contents()]
+            response_text = next((text for text in reversed(texts) if text), "")
             
             if not response_text:
                 # Fallback: get all visible text on the page after the user's message
                 logger.warning("Standard response extraction failed, using fallback method")
                 try:
-                    # Get all text content
-                    all_text = await self.page.evaluate("""() => {
-                        // Return all visible text nodes in the document
-                        const extractVisibleText = () => {
-                            const walker = document.createTreeWalker(
-                                document.body,
-                                NodeFilter.SHOW_TEXT,
-                                null,
-                                false
-                            );
-                            
-                            let text = [];
-                            let node;
-                            
-                            while(node = walker.nextNode()) {
-                                const element = node.parentElement;
-                                
-                                // Check if the element or any of its parents are hidden
-                                let isVisible = true;
-                                let parent = element;
-                                
-                                while(parent) {
-                                    const style = window.getComputedStyle(parent);
-                                    if(style.display === 'none' || style.visibility === 'hidden' || style.opacity === '0') {
-                                        isVisible = false;
-                                        break;
-                                    }
-                                    parent = parent.parentElement;
-                                }
-                                
-                                if(isVisible && node.textContent.trim()) {
-                                    text.push(node.textContent.trim());
-                                }
-                            }
-                            
-                            return text.join(' ');
-                        };
-                        
-                        return extractVisibleText();
-                    }""")
-                    
-                    # Try to extract just the response part
-                    if text and text.lower().find(text.lower()) >= 0:
-                        response_text = all_text[all_text.lower().find(text.lower()) + len(text):].strip()
+                    # Extract just the response part, after the message we sent
+                    response_text = await self.page.evaluate(VISIBLE_TEXT_JS, text)
                 except Exception as e:
                     logger.error(f"Error in fallback extraction: {e}")
             
@@ -453,10 +739,24 @@ class ReplitBrowserClient:
             return response_text
         
         except Exception as e:
-            logger.error(f"Error sending message: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception(f"Error sending message: {str(e)}")
             return f"Error: {str(e)}"
     
+    async def _wait_for_response_settled(self, idle_ms=QUIESCENCE_MS, timeout=QUIESCENCE_TIMEOUT):
+        """Wait until the response area has not changed for idle_ms
+        
+        Args:
+            idle_ms (int): How long the response must stay unchanged, in milliseconds
+            timeout (float): Maximum time to wait, in seconds
+            
+        Returns:
+            bool: True if the response settled before the timeout
+        """
+        settled = await self.page.evaluate(SETTLE_JS, [RESPONSE_SELECTOR, idle_ms, timeout * 1000])
+        if not settled:
+            logger.warning(f"Response did not settle within {timeout} seconds")
+        return settled
+    
     def get_auth_data(self):
         """Get the cached authentication data"""
         return self.auth_data
@@ -466,14 +766,14 @@ class ReplitBrowserClient:
         logger.info("Closing browser client...")
         
         try:
+            # Only this client's context goes away; the shared browser keeps running
+            if self.context:
+                await self.context.close()
+            
             if self.browser:
-                await self.browser.close()
                 self.browser = None
-                
-            if self.playwright:
-                await self.playwright.stop()
-                self.playwright = None
-                
+                await shared_playwright.release(self.headless)
+            
             self.page = None
             self.context = None
             self.initialized = False
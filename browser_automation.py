@@ -2,23 +2,42 @@ import os
 import json
 import asyncio
 import logging
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
 import logger
 
+# create_browser_automation() hands out the Playwright client unless this is
+# set; each implementation imports its browser library only when created
+USE_SELENIUM = os.environ.get('USE_SELENIUM', 'false').lower() == 'true'
+
 # Initialize logger
-log = logger.setup_logger()
+log = logging.getLogger(__name__)
+
+def _import_selenium():
+    """Import Selenium on first use, so Playwright deployments never load it"""
+    global webdriver, Options, By, WebDriverWait, EC, TimeoutException, NoSuchElementException
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException, NoSuchElementException
+
+def create_browser_automation():
+    """Create the browser automation client selected by USE_SELENIUM
+    
+    Returns:
+        ReplitBrowserAutomation or PlaywrightBrowserAutomation: Client with the
+        start/send_message/extract_token/close interface
+    """
+    if USE_SELENIUM:
+        return ReplitBrowserAutomation()
+    return PlaywrightBrowserAutomation()
 
 class ReplitBrowserAutomation:
     """A class to interact with Replit Agent through browser automation"""
     
     def __init__(self):
         """Initialize the browser automation instance"""
+        _import_selenium()
         self.driver = None
         self.initialized = False
         self.REPLIT_URL = "https://replit.com/agent"
@@ -37,19 +56,16 @@ class ReplitBrowserAutomation:
         chrome_options.add_argument("--disable-dev-shm-usage")
         chrome_options.add_argument("--disable-gpu")
         chrome_options.add_argument("--window-size=1920,1080")
+        # Return from get() at DOMContentLoaded; the input wait decides readiness
+        chrome_options.page_load_strategy = "eager"
         
         try:
-            # Initialize the Chrome driver
-            self.driver = webdriver.Chrome(options=chrome_options)
+            # Initialize the Chrome driver; WebDriver calls block, so they run in a worker thread
+            self.driver = await asyncio.to_thread(webdriver.Chrome, options=chrome_options)
             
             # Navigate to Replit Agent
             log.info(f"Navigating to {self.REPLIT_URL}...")
-            self.driver.get(self.REPLIT_URL)
-            
-            # Wait for the page to load
-            WebDriverWait(self.driver, 20).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='text'], textarea"))
-            )
+            await asyncio.to_thread(self._load_page)
             
             log.info("Browser automation initialized successfully")
             self.initialized = True
@@ -62,11 +78,18 @@ class ReplitBrowserAutomation:
         except Exception as e:
             log.error(f"Failed to initialize browser automation: {e}")
             if self.driver:
-                self.driver.quit()
+                await asyncio.to_thread(self.driver.quit)
                 self.driver = None
             self.initialized = False
             return False
     
+    def _load_page(self):
+        """Open Replit Agent and wait for the page to load"""
+        self.driver.get(self.REPLIT_URL)
+        WebDriverWait(self.driver, 20).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='text'], textarea"))
+        )
+    
     async def send_message(self, text):
         """Send a message to Replit Agent through the browser interface"""
         if not self.initialized:
@@ -75,73 +98,19 @@ class ReplitBrowserAutomation:
                 raise Exception("Failed to initialize browser automation")
         
         try:
-            # Find the input element (could be input or textarea)
-            log.info("Locating input element...")
-            input_element = None
-            
-            try:
-                input_element = self.driver.find_element(By.CSS_SELECTOR, "textarea")
-            except NoSuchElementException:
-                try:
-                    input_element = self.driver.find_element(By.CSS_SELECTOR, "input[type='text']")
-                except NoSuchElementException:
-                    raise Exception("Could not find input element")
-            
-            # Clear any existing text and enter the new message
-            input_element.clear()
-            input_element.send_keys(text)
-            
-            log.info("Finding submit button...")
-            # Find the submit button and click it
-            submit_button = None
-            
-            # Try different selectors that might identify the submit button
-            selectors = [
-                "button[type='submit']", 
-                "button.send-button", 
-                "button:has(svg)",  # Button with an SVG icon
-                "div.input-area button",  # Button in an input area
-                "form button"  # Button within a form
-            ]
-            
-            for selector in selectors:
-                try:
-                    elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                    for element in elements:
-                        if element.is_displayed() and element.is_enabled():
-                            submit_button = element
-                            break
-                    if submit_button:
-                        break
-                except:
-                    continue
-            
-            if not submit_button:
-                # As a fallback, try to press Enter key on the input field
-                log.info("Submit button not found, pressing Enter key...")
-                input_element.send_keys("\n")
-            else:
-                log.info("Clicking submit button...")
-                submit_button.click()
+            # WebDriver calls block, so each step runs in a worker thread
+            await asyncio.to_thread(self._submit_message, text)
             
             # Wait for the response to appear
             log.info("Waiting for response...")
-            
-            # Wait for the response to load (this selector might need adjustment)
-            WebDriverWait(self.driver, 60).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".agent-response, .message.response, .message:not(.user-message)"))
-            )
+            await asyncio.to_thread(self._wait_for_response)
             
             # Allow some time for the full response to be rendered
             await asyncio.sleep(2)
             
             # Extract the response text
-            response_elements = self.driver.find_elements(By.CSS_SELECTOR, ".agent-response, .message.response, .message:not(.user-message)")
-            
-            # Get the latest response (should be the last element)
-            if response_elements:
-                latest_response = response_elements[-1]
-                response_text = latest_response.text
+            response_text = await asyncio.to_thread(self._read_response)
+            if response_text is not None:
                 log.info(f"Extracted response: {response_text[:100]}...")
                 return response_text
             else:
@@ -154,6 +123,81 @@ class ReplitBrowserAutomation:
             log.error(f"Error sending message via browser automation: {e}")
             return f"Error: {str(e)}"
     
+    def _submit_message(self, text):
+        """Type the message into the input and submit it
+        
+        Args:
+            text (str): Message to send to Replit Agent
+        """
+        # Find the input element (could be input or textarea)
+        log.info("Locating input element...")
+        input_element = None
+        
+        try:
+            input_element = self.driver.find_element(By.CSS_SELECTOR, "textarea")
+        except NoSuchElementException:
+            try:
+                input_element = self.driver.find_element(By.CSS_SELECTOR, "input[type='text']")
+            except NoSuchElementException:
+                raise Exception("Could not find input element")
+        
+        # Clear any existing text and enter the new message
+        input_element.clear()
+        input_element.send_keys(text)
+        
+        log.info("Finding submit button...")
+        # Find the submit button and click it
+        submit_button = None
+        
+        # Try different selectors that might identify the submit button
+        selectors = [
+            "button[type='submit']", 
+            "button.send-button", 
+            "button:has(svg)",  # Button with an SVG icon
+            "div.input-area button",  # Button in an input area
+            "form button"  # Button within a form
+        ]
+        
+        for selector in selectors:
+            try:
+                elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
+                for element in elements:
+                    if element.is_displayed() and element.is_enabled():
+                        submit_button = element
+                        break
+                if submit_button:
+                    break
+            except:
+                continue
+        
+        if not submit_button:
+            # As a fallback, try to press Enter key on the input field
+            log.info("Submit button not found, pressing Enter key...")
+            input_element.send_keys("\n")
+        else:
+            log.info("Clicking submit button...")
+            submit_button.click()
+    
+    def _wait_for_response(self):
+        """Wait for a response element to appear"""
+        # Wait for the response to load (this selector might need adjustment)
+        WebDriverWait(self.driver, 60).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, ".agent-response, .message.response, .message:not(.user-message)"))
+        )
+    
+    def _read_response(self):
+        """Read the latest response
+        
+        Returns:
+            str: Text of the latest response, or None if there is none
+        """
+        response_elements = self.driver.find_elements(By.CSS_SELECTOR, ".agent-response, .message.response, .message:not(.user-message)")
+        
+        # Get the latest response (should be the last element)
+        if response_elements:
+            return response_elements[-1].text
+        return None
+    
     async def extract_token(self):
         """Extract authentication token from the browser session"""
         if not self.initialized or not self.driver:
@@ -195,7 +239,7 @@ class ReplitBrowserAutomation:
             return token;
             """
             
-            token = self.driver.execute_script(script)
+            token = await asyncio.to_thread(self.driver.execute_script, script)
             
             if token:
                 log.info("Successfully extracted authentication token")
@@ -219,3 +263,71 @@ class ReplitBrowserAutomation:
             finally:
                 self.driver = None
                 self.initialized = False
+
+class PlaywrightBrowserAutomation:
+    """ReplitBrowserAutomation's interface on top of the shared Playwright browser"""
+    
+    def __init__(self):
+        """Initialize the browser automation instance"""
+        from browser.browser_client_playwright import ReplitBrowserClient
+        self.client = ReplitBrowserClient()
+        self._loop = None  # Loop the client was started on; its Playwright objects live there
+        self._close_task = None
+    
+    @property
+    def initialized(self):
+        """Whether the browser has been started"""
+        return self.client.initialized
+    
+    async def start(self):
+        """Start the browser automation on the shared Playwright browser"""
+        self._loop = asyncio.get_running_loop()
+        return await self.client.start()
+    
+    async def send_message(self, text):
+        """Send a message to Replit Agent through the browser interface"""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        return await self.client.send_message(text)
+    
+    async def extract_token(self):
+        """Extract authentication token from the browser session"""
+        auth_data = await self.client.extract_auth_data()
+        if not auth_data:
+            log.warning("Could not extract authentication token")
+            return None
+        
+        # Same lookup order as the Selenium script: localStorage, then cookies
+        for source in (auth_data.get('local_storage') or {}, auth_data.get('cookies') or {}):
+            token = source.get('agent-token') or source.get('token')
+            if token:
+                log.info("Successfully extracted authentication token")
+                return token
+        
+        log.warning("Could not extract authentication token")
+        return None
+    
+    def close(self):
+        """Close the browser session
+        
+        Playwright objects belong to the loop that started them, so the close
+        runs there: as a task when called on that loop, otherwise by waiting
+        for it from this thread.
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        
+        if running is loop:
+            self._close_task = loop.create_task(self.client.close())
+        elif loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.client.close(), loop).result()
+        elif running is None:
+            loop.run_until_complete(self.client.close())
+        else:
+            log.error("Cannot close the browser session from another running event loop")
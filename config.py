@@ -1,24 +1,48 @@
 import os
 import json
+import atexit
+import threading
+import logging
 import logger
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj):
+        return json.dumps(obj, indent=2).encode()
+
 # Initialize logger
-log = logger.setup_logger()
+log = logging.getLogger(__name__)
+
+# Seconds to wait after a change before writing, so a burst of set() calls is written once
+FLUSH_DELAY = 0.5
 
 class Config:
     """Configuration manager for the application"""
     
+    __slots__ = ('config_file', 'config', '_flat', '_lock', '_flush_timer')
+    
     def __init__(self):
         """Initialize the config manager"""
         self.config_file = "config.json"
+        self._lock = threading.Lock()
+        self._flush_timer = None
         self.config = self._load_config()
+        self._flat = dict(self._flatten(self.config))  # dotted key path -> value
+        atexit.register(self.flush)
     
     def _load_config(self):
         """Load configuration from file or create default"""
         try:
             if os.path.exists(self.config_file):
-                with open(self.config_file, 'r') as f:
-                    config = json.load(f)
+                with open(self.config_file, 'rb') as f:
+                    config = _json_loads(f.read())
                 log.info("Loaded configuration from file")
                 return config
             else:
@@ -43,8 +67,7 @@ class Config:
                 }
                 
                 # Save default configuration
-                with open(self.config_file, 'w') as f:
-                    json.dump(default_config, f, indent=2)
+                self._write(default_config)
                 
                 log.info("Created default configuration file")
                 return default_config
@@ -65,42 +88,55 @@ class Config:
                 }
             }
     
+    def _flatten(self, config, prefix=""):
+        """Yield every key path in the config with its value
+        
+        Args:
+            config (dict): Configuration dictionary to walk
+            prefix (str): Key path of config itself, including the trailing dot
+            
+        Returns:
+            generator: (dotted key path, value) pairs, for sections as well as leaves
+        """
+        for key, value in config.items():
+            if value is None:
+                continue
+            path = f"{prefix}{key}"
+            yield path, value
+            if isinstance(value, dict):
+                yield from self._flatten(value, f"{path}.")
+    
     def get(self, key, default=None):
         """Get a configuration value by key path"""
-        try:
-            # Split the key path
-            parts = key.split('.')
-            value = self.config
-            
-            # Navigate through the config dictionary
-            for part in parts:
-                value = value.get(part)
-                if value is None:
-                    return default
-            
-            return value
-        except Exception:
-            return default
+        return self._flat.get(key, default)
     
     def set(self, key, value):
-        """Set a configuration value by key path"""
+        """Set a configuration value by key path
+        
+        The change is visible immediately and written to disk shortly after,
+        together with any other changes made in the meantime.
+        """
         try:
-            # Split the key path
-            parts = key.split('.')
-            
-            # Navigate to the correct location
-            config = self.config
-            for i, part in enumerate(parts[:-1]):
-                if part not in config:
-                    config[part] = {}
-                config = config[part]
-            
-            # Set the value
-            config[parts[-1]] = value
-            
-            # Save the updated configuration
-            with open(self.config_file, 'w') as f:
-                json.dump(self.config, f, indent=2)
+            with self._lock:
+                # Split the key path
+                parts = key.split('.')
+                
+                # Navigate to the correct location
+                config = self.config
+                for i, part in enumerate(parts[:-1]):
+                    if part not in config:
+                        config[part] = {}
+                    config = config[part]
+                
+                # Set the value
+                config[parts[-1]] = value
+                self._flat = dict(self._flatten(self.config))
+                
+                # Save the updated configuration
+                if self._flush_timer is None:
+                    self._flush_timer = threading.Timer(FLUSH_DELAY, self.flush)
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
             
             log.info(f"Updated configuration: {key} = {value}")
             return True
@@ -108,6 +144,25 @@ class Config:
             log.error(f"Error updating configuration: {e}")
             return False
     
+    def flush(self):
+        """Write pending configuration changes to disk"""
+        with self._lock:
+            if self._flush_timer is None:
+                return
+            self._flush_timer.cancel()
+            self._flush_timer = None
+            try:
+                self._write(self.config)
+            except Exception as e:
+                log.error(f"Error saving configuration: {e}")
+    
+    def _write(self, config):
+        """Atomically replace the config file, so readers never see a partial write"""
+        tmp_file = f"{self.config_file}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(_json_dumps(config))
+        os.replace(tmp_file, self.config_file)
+    
     def is_feature_enabled(self, feature_name):
         """Check if a feature is enabled"""
         return self.get(f"features.{feature_name}", False)
@@ -0,0 +1,57 @@
+"""Run one Chromium shared by every bot process on this machine
+
+Start this once and set CHROMIUM_CDP_ENDPOINT to the endpoint it prints in
+each bot process; they connect over CDP and each client only owns a
+BrowserContext, so the browser's memory and startup are paid for once.
+Set CHROMIUM_CDP_PORT to keep the endpoint stable across restarts.
+"""
+import os
+import time
+import asyncio
+import logging
+from playwright.async_api import async_playwright
+
+# This process launches the browser, so it must not point at another one
+os.environ.pop('CHROMIUM_CDP_ENDPOINT', None)
+
+from browser.browser_client_playwright import CDP_PORT, shared_chromium
+
+logger = logging.getLogger(__name__)
+
+async def chromium_executable_path():
+    """Get the Chromium binary installed for Playwright"""
+    async with async_playwright() as playwright:
+        return playwright.chromium.executable_path
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    executable_path = asyncio.run(chromium_executable_path())
+    
+    if not CDP_PORT:
+        logger.warning("CHROMIUM_CDP_PORT is not set; if Chromium restarts it gets a new port "
+                       "and bots must be pointed at the new endpoint")
+    
+    endpoint = shared_chromium.endpoint(executable_path)
+    print(f"CHROMIUM_CDP_ENDPOINT={endpoint}", flush=True)
+    
+    try:
+        # endpoint() relaunches the browser if it has exited
+        while True:
+            time.sleep(5)
+            try:
+                current = shared_chromium.endpoint(executable_path)
+            except Exception as e:
+                logger.error(f"Failed to relaunch shared Chromium, retrying: {e}")
+                continue
+            
+            if current != endpoint:
+                endpoint = current
+                logger.warning(f"Shared Chromium relaunched on a new endpoint: {endpoint}")
+                print(f"CHROMIUM_CDP_ENDPOINT={endpoint}", flush=True)
+    except KeyboardInterrupt:
+        logger.info("Shutting down shared Chromium")
+    finally:
+        shared_chromium.shutdown()
+
+if __name__ == "__main__":
+    main()
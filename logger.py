@@ -1,13 +1,19 @@
 import os
 import logging
 import sys
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, MemoryHandler
+
+# Handlers are attached to the root logger once per process
+_configured = False
 
 def setup_logger():
-    """Set up and configure the logger"""
-    # Create logs directory if it doesn't exist
-    log_directory = './logs'
-    os.makedirs(log_directory, exist_ok=True)
+    """Set up and configure the logger
+    
+    Safe to call more than once; later calls return the already configured logger.
+    """
+    global _configured
+    if _configured:
+        return logging.getLogger()
     
     # Configure root logger
     logger = logging.getLogger()
@@ -21,11 +27,19 @@ def setup_logger():
     console_handler.setFormatter(formatter)
     logger.addHandler(console_handler)
     
-    # Configure file handler for saving logs to a file
-    log_file = os.path.join(log_directory, 'replit_agent_bot.log')
-    file_handler = RotatingFileHandler(log_file, maxBytes=10485760, backupCount=5)  # 10 MB per file, 5 files max
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    # Configure file handler for saving logs to a file; opt-in, as hosts like
+    # Replit have slow or ephemeral disks
+    if os.environ.get('LOG_TO_FILE', '0') == '1':
+        # Create logs directory if it doesn't exist
+        log_directory = './logs'
+        os.makedirs(log_directory, exist_ok=True)
+        
+        log_file = os.path.join(log_directory, 'replit_agent_bot.log')
+        file_handler = RotatingFileHandler(log_file, maxBytes=10485760, backupCount=5)  # 10 MB per file, 5 files max
+        file_handler.setFormatter(formatter)
+        
+        # Write in batches of 100 records, and at once for errors
+        logger.addHandler(MemoryHandler(capacity=100, flushLevel=logging.ERROR, target=file_handler))
     
     # Set third-party logger levels to reduce noise
     logging.getLogger('websockets').setLevel(logging.WARNING)
@@ -35,6 +49,7 @@ def setup_logger():
     logging.getLogger('selenium').setLevel(logging.WARNING)
     
     # Return the configured logger
+    _configured = True
     return logger
 
 # Create and configure the logger when this module is imported
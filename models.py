@@ -46,4 +46,10 @@ class Message(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.now)
     
     # Relation to user
-    user = db.relationship(User, backref=db.backref('messages', lazy=True))
\ No newline at end of file
+    user = db.relationship(User, backref=db.backref('messages', lazy=True))
+
+    # History is read per user, newest first
+    __table_args__ = (
+        db.Index('ix_msg_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_msg_tuser_created', 'telegram_user_id', 'created_at'),
+    )
\ No newline at end of file
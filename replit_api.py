@@ -8,12 +8,28 @@ import time
 from utils import generate_nonce
 import logger
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj):
+        # Sent as a text frame, so hand websockets a str rather than bytes
+        return orjson.dumps(obj).decode()
+except ImportError:
+    _json_loads = json.loads
+    _json_dumps = json.dumps
+
 # Initialize logger
-log = logger.setup_logger()
+log = logging.getLogger(__name__)
 
 class ReplitAgentAPI:
     """A class for interacting with the Replit Agent API directly via WebSockets"""
     
+    __slots__ = (
+        'token', 'ws', 'connected', 'conversation_id', 'message_queue',
+        '_send_q', '_writer_task', 'BASE_WS_URL', '_url',
+    )
+    
     def __init__(self, token):
         """Initialize the ReplitAgentAPI with the provided token"""
         self.token = token
@@ -21,7 +37,10 @@ class ReplitAgentAPI:
         self.connected = False
         self.conversation_id = None
         self.message_queue = {}  # Store message IDs and responses
+        self._send_q = asyncio.Queue()  # Outbound (payload, future) pairs
+        self._writer_task = None
         self.BASE_WS_URL = "wss://replit.com/api/v1/agent/ws"
+        self._url = None
         
     async def connect(self):
         """Establish a WebSocket connection to the Replit Agent API"""
@@ -29,14 +48,24 @@ class ReplitAgentAPI:
             # Generate conversation ID if not already set
             if not self.conversation_id:
                 self.conversation_id = str(uuid.uuid4())
-                log.info(f"Generated new conversation ID: {self.conversation_id}")
+                log.info("Generated new conversation ID: %s", self.conversation_id)
             
-            # Generate URL with token and conversation ID
-            url = f"{self.BASE_WS_URL}?token={self.token}&conversationId={self.conversation_id}"
+            # Generate URL with token and conversation ID once; reconnects reuse it
+            if self._url is None:
+                self._url = f"{self.BASE_WS_URL}?token={self.token}&conversationId={self.conversation_id}"
             
             # Connect to the WebSocket
             log.info("Connecting to Replit Agent WebSocket API...")
-            self.ws = await websockets.connect(url)
+            # Responses stream as many small JSON chunks: skip per-message deflate,
+            # allow large chunks through, and ping so idle sessions are not dropped
+            self.ws = await websockets.connect(
+                self._url,
+                compression=None,
+                max_size=2 ** 22,
+                ping_interval=20,
+                ping_timeout=20,
+                write_limit=2 ** 18
+            )
             self.connected = True
             log.info("Successfully connected to Replit Agent WebSocket API")
             
@@ -45,7 +74,7 @@ class ReplitAgentAPI:
             
             return True
         except Exception as e:
-            log.error(f"Failed to connect to Replit Agent WebSocket API: {e}")
+            log.error("Failed to connect to Replit Agent WebSocket API: %s", e)
             self.connected = False
             return False
     
@@ -63,33 +92,41 @@ class ReplitAgentAPI:
             log.warning("WebSocket connection closed")
             self.connected = False
         except Exception as e:
-            log.error(f"Error listening for messages: {e}")
+            log.error("Error listening for messages: %s", e)
             self.connected = False
+        
+        # No more responses will arrive, so wake everyone still waiting
+        for entry in self.message_queue.values():
+            entry["event"].set()
     
     async def _process_message(self, message):
         """Process incoming WebSocket messages"""
         try:
-            data = json.loads(message)
+            data = _json_loads(message)
             message_id = data.get("id")
             
             if message_id and message_id in self.message_queue:
                 # Update the response for this message ID
+                entry = self.message_queue[message_id]
                 if "content" in data:
-                    self.message_queue[message_id]["response"] += data["content"]
+                    entry["chunks"].append(data["content"])
                 
                 # Check if this is the final message
                 if data.get("done", False):
-                    self.message_queue[message_id]["complete"] = True
-                    log.info(f"Received complete response for message ID: {message_id}")
+                    entry["response"] = "".join(entry["chunks"])
+                    entry["chunks"] = None
+                    entry["complete"] = True
+                    entry["event"].set()
+                    log.info("Received complete response for message ID: %s", message_id)
             
             # Log other messages for debugging
             else:
-                log.debug(f"Received message without known ID: {message[:100]}...")
+                log.debug("Received message without known ID: %.100s...", message)
                 
         except json.JSONDecodeError:
-            log.error(f"Received invalid JSON: {message[:100]}...")
+            log.error("Received invalid JSON: %.100s...", message)
         except Exception as e:
-            log.error(f"Error processing message: {e}")
+            log.error("Error processing message: %s", e)
     
     async def send_message(self, text):
         """Send a message to the Replit Agent and wait for the response"""
@@ -98,14 +135,16 @@ class ReplitAgentAPI:
             if not self.connected:
                 raise Exception("Failed to connect to Replit Agent API")
         
+        # Generate unique message ID
+        message_id = generate_nonce()
+        
         try:
-            # Generate unique message ID
-            message_id = generate_nonce()
-            
             # Initialize entry in message queue
             self.message_queue[message_id] = {
+                "chunks": [],  # joined into "response" once complete
                 "response": "",
                 "complete": False,
+                "event": asyncio.Event(),
                 "timestamp": time.time()
             }
             
@@ -117,24 +156,54 @@ class ReplitAgentAPI:
             }
             
             # Send the message
-            await self.ws.send(json.dumps(payload))
-            log.info(f"Sent message with ID: {message_id}")
+            await self._send(_json_dumps(payload))
+            log.info("Sent message with ID: %s", message_id)
             
-            # Wait for the response with timeout
+            # Wait for the response with timeout; _process_message sets the event
             timeout = 60  # 60 seconds timeout
-            start_time = time.time()
+            entry = self.message_queue[message_id]
+            try:
+                await asyncio.wait_for(entry["event"].wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError("Timed out waiting for response from Replit Agent")
             
-            while not self.message_queue[message_id]["complete"]:
-                if time.time() - start_time > timeout:
-                    raise TimeoutError("Timed out waiting for response from Replit Agent")
-                await asyncio.sleep(0.1)
+            if not entry["complete"]:
+                raise Exception("Connection closed before the response was complete")
             
             # Return the complete response
-            return self.message_queue[message_id]["response"]
+            return entry["response"]
             
         except Exception as e:
-            log.error(f"Error sending message: {e}")
+            log.error("Error sending message: %s", e)
             raise
+        finally:
+            self.message_queue.pop(message_id, None)
+    
+    async def _send(self, payload):
+        """Queue a frame for the writer task and wait until it is written"""
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._writer())
+        
+        written = asyncio.get_running_loop().create_future()
+        self._send_q.put_nowait((payload, written))
+        await written
+    
+    async def _writer(self):
+        """Drain the send queue, writing every frame queued in the same tick back-to-back"""
+        while True:
+            pending = [await self._send_q.get()]
+            while not self._send_q.empty():
+                pending.append(self._send_q.get_nowait())
+            
+            for payload, written in pending:
+                try:
+                    await self.ws.send(payload)
+                except Exception as e:
+                    if not written.done():
+                        written.set_exception(e)
+                else:
+                    if not written.done():
+                        written.set_result(None)
     
     def is_connected(self):
         """Check if the WebSocket connection is still active"""
@@ -142,6 +211,10 @@ class ReplitAgentAPI:
     
     async def close(self):
         """Close the WebSocket connection"""
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            self._writer_task = None
+        
         if self.ws:
             await self.ws.close()
             self.connected = False
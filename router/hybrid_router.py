@@ -2,13 +2,12 @@ import os
 import time
 import asyncio
 import logging
-import traceback
 import json
 from enum import Enum, auto
 
 from api.websocket_client import ReplitWebSocketClient
 from api.direct_api_client import ReplitDirectAPIClient
-from browser.browser_client import ReplitBrowserClient
+from browser.browser_client import ReplitBrowserClient, browser_client_pool
 try:
     from browser.browser_client_playwright import ReplitBrowserClient as PlaywrightBrowserClient
     HAS_PLAYWRIGHT = True
@@ -16,8 +15,23 @@ except ImportError:
     HAS_PLAYWRIGHT = False
 from auth.token_manager import TokenManager
 
+try:
+    import orjson
+
+    def _auth_fingerprint(auth_data):
+        return hash(orjson.dumps(auth_data, option=orjson.OPT_SORT_KEYS, default=str))
+except ImportError:
+    def _auth_fingerprint(auth_data):
+        return hash(json.dumps(auth_data, sort_keys=True, default=str))
+
 logger = logging.getLogger(__name__)
 
+# Read once at import; routers are created per user
+USE_PLAYWRIGHT = os.environ.get('USE_PLAYWRIGHT', 'false').lower() == 'true' and HAS_PLAYWRIGHT
+DEFAULT_COOKIES_FILE = os.environ.get('COOKIES_FILE', './storage/cookies.json')
+# Unchanged auth data is still re-stored this often so its stored_at stays fresh
+AUTH_RESTORE_INTERVAL = 3600
+
 class RouterMethod(Enum):
     """Methods that the router can use"""
     DIRECT_API = auto()
@@ -28,6 +42,17 @@ class RouterMethod(Enum):
 class HybridRouter:
     """Router that decides between direct API, WebSocket API and browser automation"""
     
+    # One router is kept per user, so skip the per-instance __dict__
+    __slots__ = (
+        'user_id', 'token_manager', 'cookies_file', 'method',
+        'ws_client', 'direct_client', 'browser_client', 'last_method_used', 'use_playwright',
+        'direct_api_failures', 'max_direct_api_failures',
+        'websocket_failures', 'max_websocket_failures',
+        'browser_failures', 'max_browser_failures',
+        'successful_api_calls', 'total_api_calls', 'auth_data',
+        '_browser_close_is_coro', '_auth_data_hash', '_auth_stored_at', '_ws_init_task',
+    )
+    
     def __init__(self, user_id, token_manager, cookies_file=None, method=RouterMethod.AUTO):
         """Initialize the hybrid router
         
@@ -39,13 +64,15 @@ class HybridRouter:
         """
         self.user_id = user_id
         self.token_manager = token_manager
-        self.cookies_file = cookies_file or os.environ.get('COOKIES_FILE', './storage/cookies.json')
+        self.cookies_file = cookies_file or DEFAULT_COOKIES_FILE
         self.method = method
         self.ws_client = None
         self.direct_client = None
         self.browser_client = None
+        self._browser_close_is_coro = False
+        self._ws_init_task = None  # Background WebSocket warm-up started alongside the direct API
         self.last_method_used = None
-        self.use_playwright = os.environ.get('USE_PLAYWRIGHT', 'false').lower() == 'true' and HAS_PLAYWRIGHT
+        self.use_playwright = USE_PLAYWRIGHT
         
         # Failure counts and thresholds
         self.direct_api_failures = 0
@@ -61,6 +88,12 @@ class HybridRouter:
         
         # Load any existing authentication data
         self.auth_data = self.token_manager.get_user_tokens(user_id)
+        self._auth_data_hash = None
+        self._auth_stored_at = 0
+        
+        # Browser-only routers need a started browser for their first message
+        if method == RouterMethod.BROWSER_AUTOMATION and not self.use_playwright:
+            browser_client_pool.warm_in_background()
     
     async def _init_direct_api(self):
         """Initialize the direct API client"""
@@ -69,7 +102,7 @@ class HybridRouter:
                 # The client is already initialized
                 return True
             
-            logger.info(f"Initializing direct API client for user {self.user_id}")
+            logger.info("Initializing direct API client for user %s", self.user_id)
             self.direct_client = ReplitDirectAPIClient(self.auth_data)
             connected = await self.direct_client.connect()
             
@@ -83,8 +116,7 @@ class HybridRouter:
                 return False
                 
         except Exception as e:
-            logger.error(f"Error initializing direct API client: {e}")
-            logger.error(traceback.format_exc())
+            logger.exception("Error initializing direct API client: %s", e)
             self.direct_api_failures += 1
             self.direct_client = None
             return False
@@ -98,7 +130,7 @@ class HybridRouter:
                 else:
                     await self.ws_client.close()  # Close existing connection if it's not connected
             
-            logger.info(f"Initializing WebSocket API client for user {self.user_id}")
+            logger.info("Initializing WebSocket API client for user %s", self.user_id)
             self.ws_client = ReplitWebSocketClient(self.auth_data)
             connected = await self.ws_client.connect()
             
@@ -112,8 +144,7 @@ class HybridRouter:
                 return False
                 
         except Exception as e:
-            logger.error(f"Error initializing WebSocket API client: {e}")
-            logger.error(traceback.format_exc())
+            logger.exception("Error initializing WebSocket API client: %s", e)
             self.websocket_failures += 1
             self.ws_client = None
             return False
@@ -124,27 +155,32 @@ class HybridRouter:
             if self.browser_client and hasattr(self.browser_client, 'initialized') and self.browser_client.initialized:
                 return True
             
-            logger.info(f"Initializing browser client for user {self.user_id}")
+            logger.info("Initializing browser client for user %s", self.user_id)
+            self._release_browser()
             
             # Use Playwright if available and configured
             if self.use_playwright and HAS_PLAYWRIGHT:
                 logger.info("Using Playwright browser client")
                 self.browser_client = PlaywrightBrowserClient(cookies_file=self.cookies_file)
+            elif self.cookies_file == browser_client_pool.cookies_file:
+                logger.info("Using pooled Selenium browser client")
+                self.browser_client = await browser_client_pool.acquire()
             else:
                 logger.info("Using Selenium browser client")
                 self.browser_client = ReplitBrowserClient(cookies_file=self.cookies_file)
-                
-            initialized = await self.browser_client.start()
+            
+            # Playwright closes asynchronously, Selenium synchronously; decide once here
+            self._browser_close_is_coro = asyncio.iscoroutinefunction(getattr(self.browser_client, 'close', None))
+            
+            initialized = self.browser_client is not None and await self.browser_client.start()
             
             if initialized:
                 logger.info("Browser client initialized successfully")
                 
                 # Extract auth data from the browser and store it
                 auth_data = await self.browser_client.extract_auth_data()
-                if auth_data:
-                    self.auth_data = auth_data
-                    self.token_manager.store_user_tokens(self.user_id, auth_data)
-                    logger.info(f"Stored authentication data for user {self.user_id}")
+                if auth_data and self._store_auth_data(auth_data):
+                    logger.info("Stored authentication data for user %s", self.user_id)
                 
                 return True
             else:
@@ -153,41 +189,93 @@ class HybridRouter:
                 return False
                 
         except Exception as e:
-            logger.error(f"Error initializing browser client: {e}")
-            logger.error(traceback.format_exc())
+            logger.exception("Error initializing browser client: %s", e)
             self.browser_failures += 1
             return False
     
+    def _store_auth_data(self, auth_data):
+        """Adopt auth data from the browser, storing it only if it changed
+        
+        Args:
+            auth_data (dict): Authentication data extracted by the browser client
+            
+        Returns:
+            bool: True if the data was written to the token manager
+        """
+        self.auth_data = auth_data
+        fingerprint = _auth_fingerprint(auth_data)
+        now = time.monotonic()
+        if fingerprint == self._auth_data_hash and now - self._auth_stored_at < AUTH_RESTORE_INTERVAL:
+            return False
+        
+        self.token_manager.store_user_tokens(self.user_id, auth_data)
+        self._auth_data_hash = fingerprint
+        self._auth_stored_at = now
+        return True
+    
+    async def _replay_browser_session(self):
+        """Let the WebSocket API retry with the session captured by the browser
+        
+        The browser's cookies and connection parameters are all the WebSocket
+        API needs, so the next message skips the browser if they work.
+        """
+        if not self.auth_data.get('connection_params'):
+            return
+        
+        if self.ws_client:
+            try:
+                await self.ws_client.close()
+            except Exception as e:
+                logger.error("Error closing WebSocket client: %s", e)
+            self.ws_client = None
+        self.websocket_failures = 0
+    
+    def _release_browser(self):
+        """Hand a pooled browser client back to its pool
+        
+        Returns:
+            bool: True if the client came from the pool
+        """
+        client = self.browser_client
+        if client is None or getattr(client, 'pool_slot', None) is None:
+            return False
+        self.browser_client = None
+        browser_client_pool.release(client)
+        return True
+    
     def _determine_method(self):
-        """Determine which method to use based on current state"""
+        """Determine which method to use based on current state
+        
+        Runs for every message, so the routine choices are only logged at debug level.
+        """
         if self.method != RouterMethod.AUTO:
             return self.method
             
         # If we have recent successful direct API calls, prefer that
         if self.direct_client and self.successful_api_calls > 0 and self.direct_api_failures < self.max_direct_api_failures:
-            logger.info("Using direct API client due to recent success")
+            logger.debug("Using direct API client due to recent success")
             return RouterMethod.DIRECT_API
             
         # If we have recent successful WebSocket API calls, prefer that
         if self.ws_client and self.successful_api_calls > 0 and self.websocket_failures < self.max_websocket_failures:
-            logger.info("Using WebSocket API client due to recent success")
+            logger.debug("Using WebSocket API client due to recent success")
             return RouterMethod.WEBSOCKET_API
         
         # Try methods in order of preference with failure checks
         
         # If direct API hasn't failed too much, try it first
         if self.direct_api_failures < self.max_direct_api_failures:
-            logger.info("Trying direct API client")
+            logger.debug("Trying direct API client")
             return RouterMethod.DIRECT_API
             
         # If WebSocket API hasn't failed too much, try it next
         if self.websocket_failures < self.max_websocket_failures:
-            logger.info("Trying WebSocket API client")
+            logger.debug("Trying WebSocket API client")
             return RouterMethod.WEBSOCKET_API
             
         # If browser automation hasn't failed too much, use that
         if self.browser_failures < self.max_browser_failures:
-            logger.info("Using browser automation as fallback")
+            logger.debug("Using browser automation as fallback")
             return RouterMethod.BROWSER_AUTOMATION
             
         # If all are failing, reset failure counts and try direct API again
@@ -219,7 +307,16 @@ class HybridRouter:
             
             # Method 1: Try Direct API
             if method == RouterMethod.DIRECT_API:
-                logger.info(f"Using direct API to send message for user {self.user_id}")
+                logger.info("Using direct API to send message for user %s", self.user_id)
+                
+                # On first use, bring the WebSocket fallback up while the direct client connects
+                if (self.method == RouterMethod.AUTO and self.direct_client is None and self.ws_client is None
+                        and self.websocket_failures < self.max_websocket_failures):
+                    # Held on the router so it is not garbage collected if the
+                    # direct API answers first; close() cancels it if still running
+                    self._ws_init_task = asyncio.create_task(self._init_websocket_api())
+                    self._ws_init_task.add_done_callback(self._ws_init_done)
+                
                 initialized = await self._init_direct_api()
                 
                 if initialized:
@@ -237,7 +334,7 @@ class HybridRouter:
                                 self.successful_api_calls += 1
                                 return response
                     except Exception as e:
-                        logger.warning(f"Direct API client failed: {e}")
+                        logger.warning("Direct API client failed: %s", e)
                         self.direct_api_failures += 1
                 
                 # If we get here, something went wrong with the Direct API
@@ -247,8 +344,8 @@ class HybridRouter:
             
             # Method 2: Try WebSocket API
             if method == RouterMethod.WEBSOCKET_API:
-                logger.info(f"Using WebSocket API to send message for user {self.user_id}")
-                initialized = await self._init_websocket_api()
+                logger.info("Using WebSocket API to send message for user %s", self.user_id)
+                initialized = await self._await_ws_init()
                 
                 if initialized:
                     try:
@@ -264,7 +361,7 @@ class HybridRouter:
                                 self.successful_api_calls += 1
                                 return response
                     except Exception as e:
-                        logger.warning(f"WebSocket API client failed: {e}")
+                        logger.warning("WebSocket API client failed: %s", e)
                         self.websocket_failures += 1
                 
                 # If we get here, something went wrong with the WebSocket API
@@ -274,7 +371,7 @@ class HybridRouter:
             
             # Method 3: Try Browser Automation (last resort)
             if method == RouterMethod.BROWSER_AUTOMATION:
-                logger.info(f"Using browser automation to send message for user {self.user_id}")
+                logger.info("Using browser automation to send message for user %s", self.user_id)
                 initialized = await self._init_browser()
                 
                 if not initialized:
@@ -289,9 +386,9 @@ class HybridRouter:
                     # Try to extract auth data for future API use
                     auth_data = await self.browser_client.extract_auth_data()
                     if auth_data:
-                        self.auth_data = auth_data
-                        self.token_manager.store_user_tokens(self.user_id, auth_data)
-                        logger.info(f"Updated authentication data for user {self.user_id}")
+                        if self._store_auth_data(auth_data):
+                            logger.info("Updated authentication data for user %s", self.user_id)
+                        await self._replay_browser_session()
                     
                     return response
                 else:
@@ -302,10 +399,43 @@ class HybridRouter:
             return "Failed to get a response from Replit Agent through any method."
             
         except Exception as e:
-            logger.error(f"Error sending message: {e}")
-            logger.error(traceback.format_exc())
+            logger.exception("Error sending message: %s", e)
+            self._cancel_ws_init()
             return f"Error: {str(e)}"
     
+    async def _await_ws_init(self):
+        """Wait for the WebSocket warm-up, or initialize the client if there is none
+        
+        The warm-up is shared by concurrent sends and one of them may cancel
+        it, so it is awaited through a shield and a cancelled warm-up falls
+        back to initializing here.
+        
+        Returns:
+            bool: True if the WebSocket API client is ready
+        """
+        task = self._ws_init_task
+        if task is not None:
+            try:
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise  # This send itself was cancelled
+        return await self._init_websocket_api()
+    
+    def _ws_init_done(self, task):
+        """Forget the WebSocket warm-up once it finishes and consume its outcome"""
+        if self._ws_init_task is task:
+            self._ws_init_task = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("WebSocket warm-up failed: %s", task.exception())
+    
+    def _cancel_ws_init(self):
+        """Cancel the WebSocket warm-up if it is still running"""
+        task = self._ws_init_task
+        self._ws_init_task = None
+        if task is not None and not task.done():
+            task.cancel()
+    
     def get_stats(self):
         """Get statistics about the router usage
         
@@ -323,7 +453,7 @@ class HybridRouter:
             "direct_api_failures": self.direct_api_failures,
             "websocket_failures": self.websocket_failures,
             "browser_failures": self.browser_failures,
-            "last_method": str(self.last_method_used).split('.')[-1] if self.last_method_used else None,
+            "last_method": self.last_method_used.name if self.last_method_used else None,
             "has_auth_data": bool(self.auth_data),
             "direct_client_active": bool(self.direct_client),
             "websocket_client_active": bool(self.ws_client),
@@ -332,6 +462,7 @@ class HybridRouter:
     
     async def close(self):
         """Close all clients"""
+        self._cancel_ws_init()
         tasks = []
         
         # Close Direct API client
@@ -339,24 +470,26 @@ class HybridRouter:
             try:
                 tasks.append(self.direct_client.close())
             except Exception as e:
-                logger.error(f"Error closing direct API client: {e}")
+                logger.error("Error closing direct API client: %s", e)
         
         # Close WebSocket client
         if self.ws_client:
             try:
                 tasks.append(self.ws_client.close())
             except Exception as e:
-                logger.error(f"Error closing WebSocket client: {e}")
+                logger.error("Error closing WebSocket client: %s", e)
         
         # Close Browser client (may be sync or async depending on implementation)
-        if self.browser_client:
+        if self._release_browser():
+            logger.info("Returned browser client to the pool")
+        elif self.browser_client:
             try:
-                if hasattr(self.browser_client, 'close') and callable(self.browser_client.close):
-                    close_method = self.browser_client.close()
-                    if asyncio.iscoroutine(close_method):
-                        tasks.append(close_method)
+                if self._browser_close_is_coro:
+                    tasks.append(self.browser_client.close())
+                else:
+                    self.browser_client.close()
             except Exception as e:
-                logger.error(f"Error closing browser client: {e}")
+                logger.error("Error closing browser client: %s", e)
         
         # Wait for all async close tasks to complete
         if tasks:
@@ -364,7 +497,7 @@ class HybridRouter:
                 await asyncio.gather(*tasks)
                 logger.info("All clients closed successfully")
             except Exception as e:
-                logger.error(f"Error during client shutdown: {e}")
+                logger.error("Error during client shutdown: %s", e)
         
         # Reset client references
         self.direct_client = None
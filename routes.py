@@ -1,15 +1,22 @@
 from flask import jsonify, render_template, request, redirect, url_for, session, flash
 from flask_login import current_user
 import os
+import sys
+import asyncio
 import threading
 import time
 import json
 import logging
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import event, tuple_
+from sqlalchemy.orm import Session
 
 from app import app, db
 from models import User, Message
 from replit_auth import login_required, make_replit_blueprint
-from telegram_bot import start_telegram_bot, get_bot_status
+from telegram_bot import start_telegram_bot, get_bot_status, router_loop, token_manager
 from router.hybrid_router import HybridRouter
 
 # Set up logging
@@ -26,7 +33,41 @@ def make_session_permanent():
 # Global variables
 bot_thread = None
 bot_started = False
-hybrid_router = None
+
+# One router per web user, so users never share a Replit session. Routers
+# keep their connections open between requests; the least recently used one
+# is closed once there are more than MAX_WEB_ROUTERS.
+MAX_WEB_ROUTERS = 1024
+_web_routers = OrderedDict()  # User ID -> HybridRouter, least recently used first
+_web_routers_lock = threading.Lock()
+
+# Clients poll /api/messages every few seconds; identical polls within this
+# window are answered from memory. Cleared whenever a commit in this process
+# writes a Message, whichever code path wrote it.
+MESSAGES_CACHE_TTL = 2
+_messages_cache = {}  # (user_id, query string) -> (expires_at, payload)
+_messages_cache_lock = threading.Lock()
+
+@event.listens_for(Message, 'after_insert')
+@event.listens_for(Message, 'after_update')
+@event.listens_for(Message, 'after_delete')
+def _mark_messages_changed(mapper, connection, target):
+    """Note on the session that it wrote messages; the cache is cleared on commit"""
+    session = Session.object_session(target)
+    if session is not None:
+        session.info['messages_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_messages_cache(session):
+    """Clear the /api/messages cache once written messages are committed"""
+    if session.info.pop('messages_changed', False):
+        with _messages_cache_lock:
+            _messages_cache.clear()
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_messages_changed(session):
+    """Drop the pending-invalidation mark of a rolled back transaction"""
+    session.info.pop('messages_changed', None)
 
 # Home route - accessible without login
 @app.route('/')
@@ -69,17 +110,24 @@ def send_message():
     if not content:
         return jsonify({'error': 'Message is required'}), 400
     
-    # Create message record
+    # Loading current_user opened a read transaction; end it so no pooled
+    # connection sits idle in a transaction during the Replit round trip.
+    # The ID is read first, since the commit expires the loaded user.
+    user_id = current_user.id
+    db.session.commit()
+    
+    # The record is written once the outcome is known, so each request costs
+    # a single commit instead of an insert plus an update
     message = Message(
-        user_id=current_user.id,
-        content=content
+        user_id=user_id,
+        content=content,
+        created_at=datetime.now()
     )
-    db.session.add(message)
-    db.session.commit()
     
     # If bot is not running, start it
-    global bot_started, hybrid_router
+    global bot_started
     if not bot_started:
+        _save_message(message)
         flash("Bot is not running. Please ask an admin to start it.", "warning")
         return jsonify({
             'error': 'Bot is not running',
@@ -87,31 +135,65 @@ def send_message():
         }), 503
     
     try:
-        # Initialize router if not already done
-        if hybrid_router is None:
-            hybrid_router = HybridRouter()
-        
-        # Send message to Replit Agent using async methods but in a sync way
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        response = loop.run_until_complete(hybrid_router.send_message(content))
-        loop.close()
-        
-        # Update message with response
-        message.response = response
-        db.session.commit()
+        router = _get_router(user_id)
         
-        return jsonify({
-            'response': response,
-            'message_id': message.id
-        })
+        # Send message to Replit Agent on the shared router loop, so the
+        # router's connections survive between requests
+        response = asyncio.run_coroutine_threadsafe(
+            router.send_message(content), router_loop
+        ).result()
     except Exception as e:
         logger.error(f"Error sending message: {e}")
+        _save_message(message)
         return jsonify({
             'error': str(e),
             'message_id': message.id
         }), 500
+    
+    # Store the message together with its response
+    message.response = response
+    _save_message(message)
+    
+    return jsonify({
+        'response': response,
+        'message_id': message.id
+    })
+
+def _get_router(user_id):
+    """Get the router for a web user, creating it on first use
+    
+    Args:
+        user_id (str): ID of the logged-in user
+        
+    Returns:
+        HybridRouter: The user's router
+    """
+    evicted = None
+    with _web_routers_lock:
+        router = _web_routers.get(user_id)
+        if router is not None:
+            _web_routers.move_to_end(user_id)
+            return router
+        
+        # Prefixed so web and Telegram users never share stored tokens
+        router = HybridRouter(user_id=f"web:{user_id}", token_manager=token_manager)
+        _web_routers[user_id] = router
+        if len(_web_routers) > MAX_WEB_ROUTERS:
+            _, evicted = _web_routers.popitem(last=False)
+    
+    if evicted is not None:
+        # Close on the loop that owns its connections
+        asyncio.run_coroutine_threadsafe(evicted.close(), router_loop)
+    return router
+
+def _save_message(message):
+    """Insert a chat message record
+    
+    Args:
+        message (Message): Message to insert
+    """
+    db.session.add(message)
+    db.session.commit()
 
 # Bot control API endpoints - admin only
 @app.route('/api/start', methods=['POST'])
@@ -161,25 +243,80 @@ def status_api():
 @login_required
 def get_messages():
     """API endpoint to get user's messages"""
-    limit = int(request.args.get('limit', 10))
-    offset = int(request.args.get('offset', 0))
+    cache_key = (current_user.id, request.query_string)
+    with _messages_cache_lock:
+        cached = _messages_cache.get(cache_key)
+    now = time.monotonic()
+    if cached and cached[0] > now:
+        return _messages_page(cached[1])
+    
+    try:
+        limit = int(request.args.get('limit', 10))
+        offset = int(request.args.get('offset', 0))
+        before_created_at = request.args.get('before_created_at') or None
+        before_id = request.args.get('before_id') or None
+        if (before_created_at is None) != (before_id is None):
+            raise ValueError("before_created_at and before_id must be given together")
+        if before_id is not None:
+            before_created_at = datetime.fromisoformat(before_created_at)
+            before_id = int(before_id)
+    except ValueError:
+        return jsonify({'error': 'Invalid pagination parameters'}), 400
     
     if current_user.is_admin and request.args.get('all') == 'true':
         # Admin can see all messages
-        messages = Message.query.order_by(Message.created_at.desc()).limit(limit).offset(offset).all()
+        query = Message.query
     else:
         # Users can only see their own messages
-        messages = Message.query.filter_by(user_id=current_user.id).order_by(
-            Message.created_at.desc()).limit(limit).offset(offset).all()
+        query = Message.query.filter_by(user_id=current_user.id)
     
-    return jsonify([{
+    keyset = before_id is not None
+    if keyset:
+        # Keyset pagination: continue after the last message of the previous
+        # page, so deep pages cost the same as the first
+        query = query.filter(tuple_(Message.created_at, Message.id) < (before_created_at, before_id))
+    
+    query = query.order_by(Message.created_at.desc(), Message.id.desc())
+    if offset and not keyset:
+        query = query.offset(offset)
+    messages = query.limit(limit).all()
+    
+    payload = [{
         'id': msg.id,
         'content': msg.content,
         'response': msg.response,
         'created_at': msg.created_at.isoformat(),
         'user_id': msg.user_id,
         'telegram_user_id': msg.telegram_user_id
-    } for msg in messages])
+    } for msg in messages]
+    with _messages_cache_lock:
+        if len(_messages_cache) >= 256:
+            _messages_cache.clear()  # Expired entries are never read again
+        _messages_cache[cache_key] = (now + MESSAGES_CACHE_TTL, payload)
+    
+    return _messages_page(payload)
+
+def _messages_page(payload):
+    """Build a /api/messages response, linking the next page when there may be one
+    
+    The body stays a plain list; the keyset cursor for the next page is sent
+    in a Link header (rel="next") built from the last message on this page.
+    
+    Args:
+        payload (list): Serialized messages of this page, newest first
+        
+    Returns:
+        Response: JSON response
+    """
+    response = jsonify(payload)
+    if payload and len(payload) == request.args.get('limit', 10, type=int):
+        last = payload[-1]
+        args = request.args.to_dict()
+        args.pop('offset', None)
+        args['before_created_at'] = last['created_at']
+        args['before_id'] = last['id']
+        response.headers['Link'] = f'<{url_for("get_messages", **args)}>; rel="next"'
+    return response
 
 def start_bot_thread():
     """Start the Telegram bot in a separate thread"""
@@ -198,9 +335,7 @@ def start_bot_thread():
         logger.info("Starting Telegram bot in threaded mode...")
         start_telegram_bot(threaded_mode=True)
     except Exception as e:
-        logger.error(f"Error starting bot: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.exception(f"Error starting bot: {e}")
 
 # Auto-start bot on application start if configured
 def auto_start_bot_on_startup():
@@ -217,9 +352,9 @@ def auto_start_bot_on_startup():
         bot_thread.start()
         bot_started = True
 
-# Register auto_start_bot to run on first request
-@app.before_request
-def check_auto_start():
-    global bot_started
-    if not bot_started and request.endpoint not in ['static']:
-        auto_start_bot_on_startup()
\ No newline at end of file
+# Auto-start once at import instead of checking on every request. Under the
+# debug reloader, main.py is also imported by the watcher process, which never
+# serves requests; only the serving child (WERKZEUG_RUN_MAIN) starts the bot.
+_main_file = getattr(sys.modules.get('__main__'), '__file__', None) or ''
+if os.path.basename(_main_file) != 'main.py' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    auto_start_bot_on_startup()
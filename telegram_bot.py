@@ -3,12 +3,14 @@ import sys
 import logging
 import asyncio
 import time
+import functools
 from datetime import datetime, timedelta
 import threading
-import traceback
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter
 from telegram.ext import (
     Updater,
     CommandHandler,
@@ -29,6 +31,35 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# The router's WebSocket clients spend their time in socket reads, writes and
+# callback dispatch, which libuv handles faster than the stdlib selector loop.
+# Only the router loop below, which routes.py shares, runs on uvloop; the
+# process-wide event loop policy is left alone.
+try:
+    import uvloop
+    HAS_UVLOOP = True
+except ImportError:
+    HAS_UVLOOP = False
+
+# Routers keep their WebSocket connections open between messages and a
+# connection belongs to the loop that opened it, so all router work runs on
+# one long-lived loop. Prompts sent while earlier ones are still streaming
+# then share the user's open socket instead of each opening a new one.
+router_loop = uvloop.new_event_loop() if HAS_UVLOOP else asyncio.new_event_loop()
+if HAS_UVLOOP:
+    logger.info("Using uvloop for the router loop")
+threading.Thread(target=router_loop.run_forever, name="router-loop", daemon=True).start()
+
+# Each message is handled on a worker thread that waits for its router call
+# and talks to Telegram; the pool bounds how many run at once, and further
+# messages queue instead of each getting a new thread
+MESSAGE_WORKERS = 32
+message_executor = ThreadPoolExecutor(max_workers=MESSAGE_WORKERS, thread_name_prefix="bot-message")
+
+# Telegram has a 4096 character limit per message
+# We'll keep it to 4000 to be safe
+MAX_MESSAGE_LENGTH = 4000
+
 # Global variables
 token_manager = TokenManager(storage_dir="./storage")
 active_routers = {}  # Store router instances for active users
@@ -99,13 +130,8 @@ def reset_command(update: Update, context: CallbackContext) -> None:
     if user_id in active_routers:
         router = active_routers[user_id]
         
-        # Create a new thread to close the router so we don't block
-        def close_router():
-            asyncio.run(router.close())
-        
-        thread = threading.Thread(target=close_router)
-        thread.daemon = True
-        thread.start()
+        # Close the router on its own loop so we don't block
+        asyncio.run_coroutine_threadsafe(router.close(), router_loop)
         
         del active_routers[user_id]
         
@@ -166,37 +192,53 @@ def handle_message(update: Update, context: CallbackContext) -> None:
         # Run the async router message sending in a separate thread
         def process_message():
             try:
-                # Create an event loop for async operations
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                
-                response_buffer = ""
+                response_parts = []
+                buffered_len = 0
+                sent_len = 0
                 last_update_time = time.time()
                 UPDATE_INTERVAL = 1  # Update message every second
+                MIN_UPDATE_DELTA = 200  # Characters of new text worth an edit
                 
                 # Callback for streaming updates
                 async def update_callback(content):
-                    nonlocal response_buffer, last_update_time
-                    response_buffer += content
+                    nonlocal buffered_len, sent_len, last_update_time
+                    response_parts.append(content)
+                    buffered_len += len(content)
+                    
+                    # Past the limit the truncated text no longer changes, and
+                    # tiny deltas are not worth a round-trip to Telegram
+                    if sent_len >= MAX_MESSAGE_LENGTH or buffered_len - sent_len < MIN_UPDATE_DELTA:
+                        return
                     
                     # Only update the message periodically to avoid Telegram API limits
                     current_time = time.time()
                     if current_time - last_update_time >= UPDATE_INTERVAL:
-                        # Format and truncate response if needed
-                        formatted_response = format_response_for_telegram(response_buffer)
+                        # Truncate only once the buffer is past the limit
+                        formatted_response = "".join(response_parts)
+                        if buffered_len > MAX_MESSAGE_LENGTH:
+                            formatted_response = format_response_for_telegram(formatted_response)
                         
                         try:
-                            context.bot.edit_message_text(
+                            # Edit from a worker thread so the shared router loop keeps running
+                            await asyncio.to_thread(
+                                context.bot.edit_message_text,
                                 chat_id=update.effective_chat.id,
                                 message_id=initial_reply.message_id,
                                 text=formatted_response
                             )
                             last_update_time = current_time
+                            sent_len = buffered_len
+                        except RetryAfter as e:
+                            # Flood control: hold off edits for as long as Telegram asks,
+                            # without stalling the stream on the router loop
+                            last_update_time = current_time + e.retry_after
                         except Exception as e:
                             logger.warning(f"Failed to update message: {e}")
                 
                 # Send the message to Replit
-                response = loop.run_until_complete(router.send_message(message_text, on_update=update_callback))
+                response = asyncio.run_coroutine_threadsafe(
+                    router.send_message(message_text, on_update=update_callback), router_loop
+                ).result()
                 
                 # Update metrics
                 bot_status["processed_messages"] += 1
@@ -222,21 +264,15 @@ def handle_message(update: Update, context: CallbackContext) -> None:
                         text="The response is too long for a single message. Here's the complete response:"
                     )
                     
-                    # Split the response into chunks of 4000 characters
-                    for i in range(0, len(formatted_response), 4000):
-                        chunk = formatted_response[i:i+4000]
-                        if chunk:
-                            context.bot.send_message(
-                                chat_id=update.effective_chat.id,
-                                text=chunk
-                            )
-                
-                # Close the event loop
-                loop.close()
+                    # Send the full response, not the truncated one, in message-sized chunks
+                    for chunk in split_response_for_telegram(response or formatted_response):
+                        context.bot.send_message(
+                            chat_id=update.effective_chat.id,
+                            text=chunk
+                        )
                 
             except Exception as e:
-                logger.error(f"Error processing message: {e}")
-                logger.error(traceback.format_exc())
+                logger.exception(f"Error processing message: {e}")
                 bot_status["errors"] += 1
                 
                 try:
@@ -249,14 +285,11 @@ def handle_message(update: Update, context: CallbackContext) -> None:
                     # In case we can't reply to the original message
                     pass
         
-        # Start processing thread
-        process_thread = threading.Thread(target=process_message)
-        process_thread.daemon = True
-        process_thread.start()
+        # Process on a pooled worker thread
+        message_executor.submit(process_message)
         
     except Exception as e:
-        logger.error(f"Error handling message: {e}")
-        logger.error(traceback.format_exc())
+        logger.exception(f"Error handling message: {e}")
         bot_status["errors"] += 1
         
         try:
@@ -270,7 +303,14 @@ def handle_message(update: Update, context: CallbackContext) -> None:
 
 def format_uptime(seconds):
     """Format uptime in seconds to a human-readable format"""
-    delta = timedelta(seconds=int(seconds))
+    return _format_whole_seconds(int(seconds))
+
+# Status is polled far more often than once a second, and uptime only grows,
+# so remembering the last second's text covers nearly every call
+@functools.lru_cache(maxsize=1)
+def _format_whole_seconds(seconds):
+    """Format a whole number of seconds, such as 1d 2h 3m 4s"""
+    delta = timedelta(seconds=seconds)
     days = delta.days
     hours, remainder = divmod(delta.seconds, 3600)
     minutes, seconds = divmod(remainder, 60)
@@ -291,20 +331,16 @@ def format_response_for_telegram(text):
     if not text:
         return ""
     
-    # Telegram has a 4096 character limit per message
-    # We'll keep it to 4000 to be safe
-    MAX_LENGTH = 4000
-    
-    if len(text) <= MAX_LENGTH:
-        return text
-    
     # If longer than the limit, truncate and add indicator
-    return text[:MAX_LENGTH - 3] + "..."
+    return text if len(text) <= MAX_MESSAGE_LENGTH else text[:MAX_MESSAGE_LENGTH - 3] + "..."
+
+def split_response_for_telegram(text):
+    """Split text into chunks that each fit in a single Telegram message"""
+    return [text[i:i + MAX_MESSAGE_LENGTH] for i in range(0, len(text), MAX_MESSAGE_LENGTH)]
 
 async def error_handler(update, context):
     """Handle errors in the telegram bot"""
-    logger.error(f"Update {update} caused error {context.error}")
-    logger.error(traceback.format_exc())
+    logger.error(f"Update {update} caused error {context.error}", exc_info=context.error)
     bot_status["errors"] += 1
 
 # Global variable to store the bot updater
@@ -330,7 +366,15 @@ def start_telegram_bot(threaded_mode=False):
     global token_manager, bot_updater
     
     # Create and configure the bot with Updater (for python-telegram-bot v13.x)
-    updater = Updater(token=telegram_token, use_context=True)
+    # The bot's urllib3 pool keeps HTTPS connections alive, but only up to
+    # con_pool_size (workers + 4 by default); calls beyond that open a fresh
+    # connection and TLS handshake each time. Size it for every message worker
+    # editing at once plus the dispatcher's own threads.
+    updater = Updater(
+        token=telegram_token,
+        use_context=True,
+        request_kwargs={'con_pool_size': MESSAGE_WORKERS + 8}
+    )
     dispatcher = updater.dispatcher
     
     # Add handlers
@@ -1,13 +1,28 @@
 import os
 import json
 import base64
+import threading
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+import logging
 import logger
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj):
+        # json.dumps stringifies non-str keys, so keep that behaviour
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj):
+        return json.dumps(obj).encode()
+
 # Initialize logger
-log = logger.setup_logger()
+log = logging.getLogger(__name__)
 
 class TokenManager:
     """A class to securely store and retrieve authentication tokens"""
@@ -17,6 +32,11 @@ class TokenManager:
         self.token_file = "tokens.enc"
         self.key = self._get_encryption_key()
         self.cipher = Fernet(self.key)
+        self._lock = threading.Lock()  # Serializes load-modify-write in save_token
+        
+        # Decrypted tokens, reused until the file's mtime changes
+        self._cache = None
+        self._cache_mtime = None
     
     def _get_encryption_key(self):
         """Get or generate the encryption key"""
@@ -59,17 +79,21 @@ class TokenManager:
     def save_token(self, token):
         """Save a token to the encrypted file"""
         try:
-            # Load existing tokens
-            tokens = self.load_tokens()
-            
-            # Add or update the token
-            tokens["api_token"] = token
-            
-            # Encrypt and save
-            encrypted_data = self.cipher.encrypt(json.dumps(tokens).encode())
-            
-            with open(self.token_file, 'wb') as f:
-                f.write(encrypted_data)
+            with self._lock:
+                # Load existing tokens
+                tokens = self.load_tokens()
+                
+                # Add or update the token
+                tokens["api_token"] = token
+                
+                # Encrypt and save; readers see either the old or the new file, never a partial one
+                encrypted_data = self.cipher.encrypt(_json_dumps(tokens))
+                tmp_path = f"{self.token_file}.tmp"
+                
+                with open(tmp_path, 'wb') as f:
+                    f.write(encrypted_data)
+                os.replace(tmp_path, self.token_file)
+                self._cache = None
             
             log.info("Token saved successfully")
             return True
@@ -80,16 +104,23 @@ class TokenManager:
     def load_tokens(self):
         """Load tokens from the encrypted file"""
         try:
-            if not os.path.exists(self.token_file):
+            try:
+                mtime = os.stat(self.token_file).st_mtime_ns
+            except FileNotFoundError:
                 return {}
             
+            # Only decrypt again when the file has changed
+            if self._cache is not None and mtime == self._cache_mtime:
+                return dict(self._cache)
+            
             with open(self.token_file, 'rb') as f:
                 encrypted_data = f.read()
             
             decrypted_data = self.cipher.decrypt(encrypted_data)
-            tokens = json.loads(decrypted_data.decode())
+            tokens = _json_loads(decrypted_data)
+            self._cache, self._cache_mtime = tokens, mtime
             
-            return tokens
+            return dict(tokens)
         except Exception as e:
             log.error(f"Error loading tokens: {e}")
             return {}
@@ -105,6 +136,7 @@ class TokenManager:
             if os.path.exists(self.token_file):
                 os.remove(self.token_file)
                 log.info("Token file deleted")
+            self._cache = None
             return True
         except Exception as e:
             log.error(f"Error deleting token: {e}")